@@ -14,8 +14,7 @@ from plumbing.graphs import Graph
 from plumbing.common import split_thousands as thousands
 
 # Third party modules #
-import matplotlib
-from matplotlib import pyplot
+import numpy
 
 # Constants #
 __all__ = ['OtuSizesDist', 'OtuSumsPerSample', 'SampleSumsPerOtu',
@@ -37,20 +36,27 @@ class OtuSizesDist(Graph):
     height       = 6
 
     def plot(self, **kwargs):
+        # Nothing to draw on an empty table #
+        if self.parent.df.empty: return plot_empty(self, **kwargs)
+        # Import #
+        pyplot = import_pyplot()
         # Sum by row and count frequencies #
-        distrib = self.parent.df.sum(axis=1).value_counts()
+        row_sums = self.parent.reductions.row_sum.astype(numpy.int64)
         # Get x and y values #
-        x = distrib.keys()
-        y = distrib.values
+        y = numpy.bincount(row_sums)
+        x = numpy.nonzero(y)[0]
+        y = y[x]
         # Make scatter #
         fig = pyplot.figure()
-        axes = fig.add_subplot(111)
-        axes.plot(x, y, 'ro')
-        axes.set_title('Distribution of sizes for %s OTUs' % thousands(sum(y)))
-        # Save it #
-        self.save_plot(fig, axes, **kwargs)
-        # Close #
-        pyplot.close(fig)
+        try:
+            axes = fig.add_subplot(111)
+            axes.plot(x, y, 'ro')
+            axes.set_title('Distribution of sizes for %s OTUs' % thousands(sum(y)))
+            # Save it #
+            self.save_plot(fig, axes, **kwargs)
+        # Close, even if an error occurred #
+        finally:
+            pyplot.close(fig)
 
 ################################################################################
 class OtuSumsPerSample(Graph):
@@ -66,15 +72,25 @@ class OtuSumsPerSample(Graph):
     remove_frame = True
 
     def plot(self, **kwargs):
-        # Sum by column #
-        self.frame = self.parent.df.astype(bool).sum()
-        # Make histogram #
+        # Nothing to draw on an empty table #
+        if self.parent.df.empty: return plot_empty(self, **kwargs)
+        # Import #
+        pyplot = import_pyplot()
+        # Count non-null OTUs in each sample #
+        self.counts = self.parent.reductions.col_nonzero
+        # Compute the histogram ourselves #
+        heights, edges = numpy.histogram(self.counts, bins=40)
+        # Draw it as a bar plot #
         fig = pyplot.figure()
-        axes = self.frame.hist(color='gray', bins=40)
-        # Save it #
-        self.save_plot(fig, axes, **kwargs)
-        # Close #
-        pyplot.close(fig)
+        try:
+            axes = fig.add_subplot(111)
+            axes.bar(edges[:-1], heights, width=numpy.diff(edges), align='edge',
+                     color='gray')
+            # Save it #
+            self.save_plot(fig, axes, **kwargs)
+        # Close, even if an error occurred #
+        finally:
+            pyplot.close(fig)
 
 ################################################################################
 class SampleSumsPerOtu(Graph):
@@ -87,19 +103,26 @@ class SampleSumsPerOtu(Graph):
     remove_frame = True
 
     def plot(self, **kwargs):
-        # Sum by column and count frequencies #
-        df = self.parent.df.astype(bool).sum(axis=1)
-        df = df.value_counts().sort_index()
+        # Nothing to draw on an empty table #
+        if self.parent.df.empty: return plot_empty(self, **kwargs)
+        # Imports #
+        pyplot = import_pyplot()
+        import pandas
+        # Count samples each OTU appears in and count frequencies #
+        counts = self.parent.reductions.row_nonzero
+        df = pandas.Series(counts).value_counts().sort_index()
         # Make histogram #
         fig = pyplot.figure()
-        axes = df.plot(kind='bar', color='gray')
-        # Set X label #
-        msg = 'Number of samples an OTU appears in (max. %i)'
-        axes.set_xlabel(msg % self.parent.df.T.shape[0])
-        # Save it #
-        self.save_plot(fig, axes, **kwargs)
-        # Close #
-        pyplot.close(fig)
+        try:
+            axes = df.plot(kind='bar', color='gray')
+            # Set X label #
+            msg = 'Number of samples an OTU appears in (max. %i)'
+            axes.set_xlabel(msg % self.parent.df.shape[1])
+            # Save it #
+            self.save_plot(fig, axes, **kwargs)
+        # Close, even if an error occurred #
+        finally:
+            pyplot.close(fig)
 
 ################################################################################
 class CumulativePresence(Graph):
@@ -128,38 +151,79 @@ class CumulativePresence(Graph):
     remove_frame = True
 
     def plot(self, **kwargs):
+        # Nothing to draw on an empty table #
+        if self.parent.df.empty: return plot_empty(self, **kwargs)
+        # Import #
+        pyplot = import_pyplot()
         # Number of samples #
         num_of_otus    = self.parent.df.shape[0]
         num_of_samples = self.parent.df.shape[1]
-        # Create an index #
-        samples_index  = list(reversed(range(1, num_of_samples+1)))
-        # Get value frequencies #
-        counts = self.parent.df.astype(bool).sum(axis=1).value_counts()
-        # Add missing values #
-        for n in samples_index:
-            if n not in counts:
-                counts.at[n] = 0
-        # Sort it #
-        counts = counts.sort_index(ascending=False)
-        # Cumulative sum #
-        self.y = list(counts.cumsum())
+        # Number of samples each OTU appears in #
+        sums = self.parent.reductions.row_nonzero
+        # Get value frequencies, including the missing values as zeros #
+        counts = numpy.bincount(sums, minlength=num_of_samples+1)[1:]
+        # Cumulative sum starting from the most samples #
+        self.y = numpy.cumsum(counts[::-1]).tolist()
         # Percentage of samples #
-        self.x = [n/num_of_samples for n in samples_index]
+        self.x = (numpy.arange(num_of_samples, 0, -1) / num_of_samples).tolist()
         # Make a step plot #
         fig = pyplot.figure()
+        try:
+            axes = fig.add_subplot(111)
+            axes.step(self.x, self.y, fillstyle='bottom')
+            # Set titles #
+            axes.set_title('Cumulative graph of OTU presence in samples for %s OTUs' % num_of_otus)
+            axes.set_xlabel('Fraction of samples (100%% equates %i samples)' % num_of_samples)
+            axes.invert_xaxis()
+            # Fine tuning #
+            axes.set_xticks([min(self.x) + (max(self.x)-min(self.x)) * n / 9 for n in range(10)])
+            axes.set_yscale('log')
+            # Set percentage #
+            percentage = lambda x, pos: '%1.0f%%' % (x*100.0)
+            from matplotlib.ticker import FuncFormatter
+            axes.xaxis.set_major_formatter(FuncFormatter(percentage))
+            # Save it #
+            self.save_plot(fig, axes, **kwargs)
+        # Close, even if an error occurred #
+        finally:
+            pyplot.close(fig)
+
+################################################################################
+def import_pyplot():
+    """
+    Return the `pyplot` module of matplotlib. It is only imported when a
+    graph is actually drawn, as importing it is slow. The backend is left
+    as configured by the user.
+    """
+    from matplotlib import pyplot
+    return pyplot
+
+def plot_empty(graph, **kwargs):
+    """
+    Save a placeholder figure for the `graph` when the OTU table is empty,
+    so that the file exists and the report can still include it.
+    """
+    # Import #
+    pyplot = import_pyplot()
+    # Log scales make no sense without any data #
+    kwargs = dict(kwargs, x_scale='linear', y_scale='linear')
+    # Write a message instead of the data #
+    fig = pyplot.figure()
+    try:
         axes = fig.add_subplot(111)
-        axes.step(self.x, self.y, fillstyle='bottom')
-        # Set titles #
-        axes.set_title('Cumulative graph of OTU presence in samples for %s OTUs' % num_of_otus)
-        axes.set_xlabel('Fraction of samples (100%% equates %i samples)' % num_of_samples)
-        axes.invert_xaxis()
-        # Fine tuning #
-        axes.set_xticks([min(self.x) + (max(self.x)-min(self.x)) * n / 9 for n in range(10)])
-        axes.set_yscale('log')
-        # Set percentage #
-        percentage = lambda x, pos: '%1.0f%%' % (x*100.0)
-        axes.xaxis.set_major_formatter(matplotlib.ticker.FuncFormatter(percentage))
+        axes.text(0.5, 0.5, 'The OTU table is empty', ha='center',
+                  va='center', fontsize=16, transform=axes.transAxes)
+        axes.set_xticks([])
+        axes.set_yticks([])
         # Save it #
-        self.save_plot(fig, axes, **kwargs)
-        # Close #
+        graph.save_plot(fig, axes, **kwargs)
+    # Close, even if an error occurred #
+    finally:
         pyplot.close(fig)
+
+################################################################################
+# All the graph classes along with their short names, built only once #
+GRAPH_CLASSES = [(cls.short_name, cls) for cls in (OtuSizesDist,
+                                                   OtuSumsPerSample,
+                                                   SampleSumsPerOtu,
+                                                   CumulativePresence)]
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+
+Compiled kernel used by `OtuTable.reductions` on very large OTU tables.
+This module requires the optional `numba` package and should only be
+imported when needed.
+"""
+
+# Built-in modules #
+
+# Third party modules #
+import numba, numpy
+
+###############################################################################
+@numba.njit(parallel=True, cache=True)
+def reduce_blocks(arr, row_sum, row_nonzero, col_nonzero_blocks):
+    """
+    Fill in the row sums, the row presence counts and the column presence
+    counts of `arr` in a single pass without allocating a boolean matrix.
+    Every block of rows accumulates its column counts in its own buffer
+    to avoid threads writing to the same memory.
+    """
+    num_rows, num_cols = arr.shape
+    num_blocks = col_nonzero_blocks.shape[0]
+    for b in numba.prange(num_blocks):
+        start = num_rows * b // num_blocks
+        end   = num_rows * (b + 1) // num_blocks
+        for i in range(start, end):
+            total = 0
+            count = 0
+            for j in range(num_cols):
+                v = arr[i, j]
+                total += v
+                if v != 0:
+                    count += 1
+                    col_nonzero_blocks[b, j] += 1
+            row_sum[i]     = total
+            row_nonzero[i] = count
+
+def reduce_counts(arr):
+    """
+    Return the tuple `(row_sum, row_nonzero, col_nonzero)` for a 2D array
+    of counts, computed by the compiled kernel above.
+    """
+    num_rows, num_cols = arr.shape
+    num_blocks  = numba.get_num_threads()
+    row_sum     = numpy.zeros(num_rows, dtype=numpy.int64)
+    row_nonzero = numpy.zeros(num_rows, dtype=numpy.int64)
+    blocks      = numpy.zeros((num_blocks, num_cols), dtype=numpy.int64)
+    reduce_blocks(arr, row_sum, row_nonzero, blocks)
+    return row_sum, row_nonzero, blocks.sum(axis=0)
@@ -8,16 +8,17 @@ Contact at www.sinclair.bio
 """
 
 # Built-in modules #
+from types import SimpleNamespace
 
 # Internal modules #
-import pacmill.centering.otu_graphs
+from pacmill.core.cache_files import save_atomically
 
 # First party modules #
 from plumbing.cache import property_cached
 from autopaths.file_path import FilePath
 
 # Third party modules #
-import pandas
+import numpy
 
 # Constants #
 class Dummy: pass
@@ -28,6 +29,8 @@ class OtuTable:
     def __init__(self, tsv_path):
         # Record the tsv path #
         self.tsv_path = FilePath(tsv_path)
+        # A columnar binary copy of the table that is much faster to load #
+        self.parquet_path = FilePath(self.tsv_path + '.parquet')
         # Pick a directory for storing the graphs #
         self.graphs_dir = self.tsv_path.directory + 'graphs/'
 
@@ -37,12 +40,77 @@ class OtuTable:
         Parse the TSV file and return a pandas.DataFrame object.
         Returns a table with OTU as rows and samples as columns which tracks
         how many sequences where found from each sample in each OTU.
+        After the first parse, the table is cached in the Parquet format
+        next to the TSV file and that cache is used while it is up to date.
         """
-        # Parse #
-        df = pandas.read_csv(str(self.tsv_path), '\t', index_col=0)
+        # Import #
+        import pandas
+        # Use the binary cache if it was written after the TSV #
+        # A cache that can't be read for any reason is simply made again
+        cache = self.parquet_path
+        if cache.exists and cache.mdate > self.tsv_path.mdate:
+            try: return pandas.read_parquet(cache.path)
+            except Exception: pass
+        # The counts are always integers, except for the first column #
+        samples = self.tsv_path.first.rstrip('\n').split('\t')[1:]
+        dtype   = {sample: numpy.int32 for sample in samples}
+        # Parse with the fast C engine and no type inference #
+        params = dict(sep='\t', index_col=0, engine='c', memory_map=True)
+        try:
+            df = pandas.read_csv(str(self.tsv_path), dtype=dtype, **params)
+        # In case the table contains non-integer values somehow #
+        except ValueError:
+            df = pandas.read_csv(str(self.tsv_path), low_memory=False, **params)
+        # Store a binary cache for the next time, if `pyarrow` is installed #
+        write = lambda path: df.to_parquet(path, compression='snappy')
+        try: save_atomically(write, cache)
+        except (ImportError, OSError): pass
         # Return #
         return df
 
+    @property_cached
+    def count_matrix(self):
+        """
+        The counts of `self.df` as a plain numpy array without copying them.
+        Reducing this directly avoids the temporary copy of the whole table
+        that pandas makes when calling `DataFrame.sum`.
+        """
+        return self.df.to_numpy(copy=False)
+
+    # Above this number of cells, use the `numba` kernel when installed #
+    numba_threshold = 10**8
+
+    @property_cached
+    def reductions(self):
+        """
+        All the sums that the graphs need, computed once per OTU table
+        instead of once per graph. The result has three attributes:
+
+            * row_sum:     the number of sequences in each OTU.
+            * row_nonzero: the number of samples each OTU appears in.
+            * col_nonzero: the number of OTUs present in each sample.
+
+        For very large tables, the optional `numba` package is used to
+        compute all three in a single pass without any temporary matrix.
+        """
+        # The raw counts #
+        arr = self.count_matrix
+        # On huge tables, fuse all sums in one parallel pass if we can #
+        if arr.size >= self.numba_threshold and arr.dtype.kind in 'iu':
+            try:
+                from pacmill.centering.otu_reduce import reduce_counts
+            except ImportError:
+                pass
+            else:
+                row_sum, row_nonzero, col_nonzero = reduce_counts(arr)
+                return SimpleNamespace(row_sum     = row_sum,
+                                       row_nonzero = row_nonzero,
+                                       col_nonzero = col_nonzero)
+        # Otherwise let numpy do it #
+        return SimpleNamespace(row_sum     = arr.sum(axis=1),
+                               row_nonzero = numpy.count_nonzero(arr, axis=1),
+                               col_nonzero = numpy.count_nonzero(arr, axis=0))
+
     @property_cached
     def graphs(self):
         """
@@ -50,11 +118,12 @@ class OtuTable:
         are all the graphs found in `otu_graphs.py` initialized with this
         instance as only argument.
         """
+        # Import #
+        from pacmill.centering.otu_graphs import GRAPH_CLASSES
         # Make a dummy object #
         result = Dummy()
         # Loop over graphs #
-        for graph_name in pacmill.centering.otu_graphs.__all__:
-            graph_cls = getattr(pacmill.centering.otu_graphs, graph_name)
-            setattr(result, graph_cls.short_name, graph_cls(self))
+        for short_name, graph_cls in GRAPH_CLASSES:
+            setattr(result, short_name, graph_cls(self))
         # Return #
         return result
@@ -8,16 +8,32 @@ Contact at www.sinclair.bio
 """
 
 # Built-in modules #
-import multiprocessing, re, shutil
+import os, multiprocessing, shutil, functools, subprocess
 
 # First party modules #
 from fasta import FASTA, FASTQ
 from plumbing.check_cmd_found import check_cmd
 from plumbing.cache           import property_cached
 from autopaths.file_path      import FilePath
+from autopaths.tmp_path       import new_temp_path
 
 # Third party modules #
-import sh, pandas
+import sh, pandas, numpy
+
+###############################################################################
+@functools.lru_cache(maxsize=None)
+def check_vsearch():
+    """
+    Check that vsearch is installed and that it is the expected version.
+    The result is memoized so that we only spawn these two processes once
+    per python session, instead of once per clustering.
+    """
+    # Check it is installed #
+    check_cmd('vsearch', True)
+    # Check version #
+    assert b"v2.14.1" in sh.vsearch('--version').stderr
+    # Return #
+    return True
 
 ###############################################################################
 class ClusterVsearch:
@@ -75,7 +91,7 @@ class ClusterVsearch:
         # Call vsearch #
         self.cluster(cpus, verbose)
         # Filter OTUs that are too small #
-        if self.min_size > 1: self.dereplicate(verbose)
+        if self.min_size > 1: self.dereplicate(verbose, cpus)
         # Return #
         return self.otus
 
@@ -89,55 +105,75 @@ class ClusterVsearch:
         if verbose:
             msg = "Running OTU creation on '%s'"
             print(msg % self.source)
-        # Check it is installed #
-        check_cmd('vsearch', True)
-        # Check version #
-        assert b"v2.14.1" in sh.vsearch('--version').stderr
+        # Check it is installed and the version is correct #
+        check_vsearch()
         # Number of cores #
         if cpus is None: cpus = min(multiprocessing.cpu_count(), 32)
         # Pick the command parameters #
-        command = ("--cluster_size", self.source,
-                   "--consout",      self.otus,
-                   "--id",           self.threshold,
-                   "--otutabout",    self.table,
-                   "--threads",      cpus)
+        command = ["vsearch",
+                   "--cluster_size", str(self.source),
+                   "--consout",      str(self.otus),
+                   "--id",           str(self.threshold),
+                   "--otutabout",    str(self.table),
+                   "--threads",      str(cpus)]
         # Run the command on the input FASTA file #
-        sh.vsearch(command)
+        # Its messages and errors on stderr are shown as they come
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
         # Return #
         return self.otus
 
-    def dereplicate(self, verbose=True):
+    # Above this size in bytes, the OTU FASTA is filtered in parallel #
+    parallel_threshold = 64 * 1024**2
+
+    def dereplicate(self, verbose=True, cpus=None):
         """
         We will read the TSV table at `self.table` and remove OTUs that are
         below the self.min_size threshold. Following which, we will read the
         FASTA file at `self.otus` and remove the same sequences that are no
-        longer required.
+        longer required. A large FASTA file is split into byte ranges that
+        are filtered in parallel by several processes.
         """
         # Message #
         if verbose:
             msg = "Removing low abundance OTUs on '%s'"
             print(msg % self.otus)
-        # Load table #
-        df = pandas.read_csv(self.table, sep='\t', index_col=0)
-        # Sum and sort #
-        totals = df.sum(axis=1).sort_values(ascending=False)
-        # Get the sequences IDs to drop and those to keep #
-        self.keep_ids = list(totals[totals >= self.min_size].index)
-        self.drop_ids = list(totals[totals <  self.min_size].index)
-        # Filter the dataframe #
-        df = df.loc[self.keep_ids]
+        # The counts are always integers, except for the first column #
+        samples = self.table.first.rstrip('\n').split('\t')[1:]
+        dtype   = {sample: numpy.int32 for sample in samples}
+        # Load the table by chunks so that it is never fully in memory #
+        chunks = pandas.read_csv(self.table, sep='\t', index_col=0,
+                                 dtype=dtype, chunksize=4096)
+        # Filter every chunk and write it to a new table #
+        new_table = self.table + '.filtered'
+        self.keep_ids, self.drop_ids = [], []
+        for i, chunk in enumerate(chunks):
+            # Sum every OTU #
+            totals = chunk.sum(axis=1)
+            mask   = totals >= self.min_size
+            # Get the sequences IDs to drop and those to keep #
+            self.keep_ids += totals.index[mask].tolist()
+            self.drop_ids += totals.index[~mask].tolist()
+            # Append the rows to keep #
+            chunk.loc[mask].to_csv(new_table, sep='\t', mode='a' if i else 'w',
+                                   header=(i == 0))
+        # If no OTU is too small there is no need to rewrite any file #
+        if not self.drop_ids:
+            os.remove(new_table)
+            return self.otus
         # Backup the old table and replace it #
         shutil.move(self.table, self.table + '.unfiltered')
-        df.to_csv(self.table.path, sep='\t')
-        # Function for filtering reads #
-        def keep_reads_if(title):
-            pattern  = r'\Acentroid=(.+);seqs=[0-9]+\Z'
-            otu_name = re.findall(pattern, title)[0]
-            if otu_name in self.keep_ids: return True
-            return False
-        # Filter the FASTA file #
-        self.otus.copy(self.otus + '.unfiltered')
-        self.otus.extract_sequences(keep_reads_if, in_place=True)
+        shutil.move(new_table, self.table)
+        # Use a set for fast membership tests #
+        keep = frozenset(self.keep_ids)
+        # Number of cores #
+        if cpus is None: cpus = min(multiprocessing.cpu_count(), 32)
+        # Filter the FASTA file into a new file #
+        filtered = self.otus + '.filtered'
+        filter_otus(self.otus.path, filtered, keep, cpus,
+                    self.parallel_threshold)
+        # Backup the old FASTA and replace it without copying any data #
+        shutil.move(self.otus, self.otus + '.unfiltered')
+        shutil.move(filtered, self.otus)
         # Return #
         return self.otus
 
@@ -163,4 +199,86 @@ class ClusterVsearch:
 ###############################################################################
 class ClusteringResults(FASTA):
     """A file with the results."""
-    pass
\ No newline at end of file
+    pass
+
+###############################################################################
+def keep_otu(title, keep):
+    """
+    Given the title of a sequence in the OTU FASTA such as
+    `centroid=sample_1:1034;seqs=128`, return True if the OTU name
+    `sample_1:1034` is part of the `keep` set. A title that doesn't follow
+    this format raises a ValueError, as the FASTA and the TSV would
+    otherwise silently disagree.
+    """
+    # Check the prefix and the suffix #
+    end   = title.rfind(';seqs=')
+    count = title[end+len(';seqs='):]
+    valid = title.startswith('centroid=') and end != -1 and count.isdigit()
+    if not valid:
+        msg = "The OTU title '%s' is not of the form 'centroid=NAME;seqs=N'."
+        raise ValueError(msg % title)
+    # Look up the name in between #
+    return title[len('centroid='):end] in keep
+
+def filter_otus(path, out_path, keep, cpus=1, threshold=0):
+    """
+    Write to `out_path` the records of the FASTA file at `path` that are
+    OTUs found in `keep`. If the file is larger than `threshold` bytes, it
+    is split into `cpus` byte ranges that are filtered in parallel by as
+    many processes and then concatenated. Otherwise it is filtered
+    directly by the current process.
+    """
+    # Small files are not worth starting other processes for #
+    size = os.path.getsize(path)
+    if cpus <= 1 or size <= threshold:
+        return filter_otus_chunk((path, 0, size, keep, out_path))
+    # Split the FASTA file in as many byte ranges as we have cores #
+    bounds = [size * i // cpus for i in range(cpus + 1)]
+    chunks = [(path, start, end, keep, new_temp_path())
+              for start, end in zip(bounds[:-1], bounds[1:])]
+    # Filter every chunk in parallel, each one into its own file #
+    # Forking could deadlock if threads were started, e.g. by `numba` #
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(cpus) as pool:
+        parts = list(pool.imap(filter_otus_chunk, chunks))
+    # Concatenate the chunks into the new file #
+    with open(out_path, 'wb') as handle:
+        for part in parts:
+            with open(part, 'rb') as chunk:
+                shutil.copyfileobj(chunk, handle)
+            os.remove(part)
+    # Return #
+    return out_path
+
+def filter_otus_chunk(args):
+    """
+    Filter the records of a FASTA file whose title starts between the byte
+    offsets `start` and `end`, keeping only the OTUs found in `keep`.
+    The kept records are written untouched to `out_path` which is returned.
+    This function is at the module level so that it can be sent to
+    worker processes.
+    """
+    # Unpack the arguments #
+    path, start, end, keep, out_path = args
+    # Open both files #
+    with open(path, 'rb') as handle, open(out_path, 'wb') as out:
+        # Position ourselves at the start of the first line in the range #
+        if start > 0:
+            handle.seek(start - 1)
+            handle.readline()
+        # Are we keeping the current record #
+        keeping = False
+        # Iterate over lines #
+        while True:
+            position = handle.tell()
+            line     = handle.readline()
+            if not line: break
+            # A new record starts here #
+            if line.startswith(b'>'):
+                if position >= end: break
+                title   = line[1:].split(None, 1)[0].decode()
+                keeping = keep_otu(title, keep)
+            # Write the line if we are keeping this record #
+            if keeping: out.write(line)
+    # Return #
+    return out_path
\ No newline at end of file
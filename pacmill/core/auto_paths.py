@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+"""
+
+# Built-in modules #
+
+# First party modules #
+from autopaths.auto_paths import AutoPaths
+
+###############################################################################
+class CachedAutoPaths(AutoPaths):
+    """
+    Same as the AutoPaths object, except that every path is only searched
+    for the first time it is accessed. Afterwards, the result is stored
+    as a plain instance attribute so that Python finds it directly without
+    going through `__getattr__` again.
+
+    Note that the directory containing a path is hence only created the
+    first time that path is accessed.
+    """
+
+    def __getattr__(self, key):
+        # Private and special attributes are not cached #
+        if key.startswith('_'): return super().__getattr__(key)
+        # Search for the path only once #
+        result = super().__getattr__(key)
+        self.__dict__[key] = result
+        # Return #
+        return result
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+"""
+
+# Built-in modules #
+import os, tempfile
+
+###############################################################################
+def save_atomically(write, path):
+    """
+    Call the function `write` with a temporary path next to `path`, and
+    then move the resulting file to `path` in a single step. Hence, a cache
+    file is never seen half written by another process, even if we crash
+    or if two processes write the same cache at the same time.
+    """
+    # The temporary file must be on the same file system #
+    directory, name = os.path.split(str(path))
+    handle, tmp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp',
+                                        dir=directory or None)
+    os.close(handle)
+    # Write and move, or clean up #
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
\ No newline at end of file
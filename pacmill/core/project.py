@@ -8,6 +8,7 @@ Contact at www.sinclair.bio
 """
 
 # Built-in modules #
+import os, re, shutil, hashlib, itertools, multiprocessing, collections.abc
 
 # Third party modules #
 import pandas
@@ -18,6 +19,215 @@ from autopaths.dir_path import DirectoryPath
 from plumbing.cache import property_cached
 
 # Internal modules #
+from pacmill.core.cache_files import save_atomically
+
+# Sample names can only contain alphanumerics and underscores #
+valid_name = re.compile(r'[A-Za-z_]\w*')
+
+###############################################################################
+# Columns that are always text, so no type inference is needed #
+str_cols = {'project_short_name': str,
+            'sample_short_name':  str,
+            'used':               str}
+
+def read_xlsx(path):
+    """
+    Parse one excel metadata file and return a pandas.DataFrame object.
+    The empty columns used as spacers in the excel file are skipped.
+    """
+    usecols = lambda name: not str(name).startswith('Unnamed')
+    # Integer columns with empty cells are cast later by the Project #
+    return pandas.read_excel(str(path), header=1, usecols=usecols,
+                             dtype=str_cols)
+
+def to_records(df):
+    """
+    Convert a pandas.DataFrame to a list of dictionaries, one per row.
+    If `pyarrow` is installed the conversion goes through an Arrow table,
+    which produces plain python objects without boxing every cell in
+    pandas first. Missing values then become None instead of NaN or NA.
+    Arrow needs one type per column, so if a column mixes several types
+    of cells, such as numbers and text, we fall back on pandas.
+    """
+    try: import pyarrow
+    except ImportError: return df.to_dict(orient='records')
+    try: table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        return df.to_dict(orient='records')
+    records = table.to_pylist()
+    # Arrow gives dates as `datetime` objects, put back the pandas ones #
+    dates = [field.name for field in table.schema
+             if pyarrow.types.is_timestamp(field.type)]
+    for name in dates:
+        for record, value in zip(records, df[name]): record[name] = value
+    # Return #
+    return records
+
+def read_project_rows(args):
+    """
+    Read the excel file at `path` and return only the rows of the project
+    called `short_name`. The project short name is compared without regard
+    to case, so that upper case names can be reported as errors.
+    This function is at the module level so that it can be sent to
+    worker processes.
+    """
+    # Unpack the arguments #
+    path, short_name = args
+    # Keep only this project #
+    df = read_xlsx(path)
+    df = df[df['project_short_name'].str.lower() == short_name]
+    # Check the proj short names are only lower case #
+    if (df['project_short_name'] != short_name).any():
+        msg = "The short name of a project can only contain " \
+              "alphanumerical characters and underscores. "   \
+              "Also it cannot contain upper case characters. " \
+              "Please check the file '%s'."
+        raise ValueError(msg % path)
+    # Return #
+    return df
+
+def to_integers(df, key, used):
+    """
+    Return the column `key` of the metadata `df` converted to the nullable
+    integer type. Empty cells become NA. In the rows selected by the boolean
+    mask `used`, any other cell that is not a whole number raises an error
+    naming the column and the sample. The rows of samples that are not used
+    are not checked, and such cells simply become NA there.
+    """
+    # The message in case of error #
+    msg = "The `%s` entry of sample '%s' must be an integer. " \
+          "It currently is: '%s'"
+    column = df.loc[used, key]
+    names  = df.loc[used, 'sample_short_name']
+    # Parse the numbers, keeping the original value of a wrong cell #
+    try: values = pandas.to_numeric(column, errors='raise')
+    except (ValueError, TypeError):
+        parsed = pandas.to_numeric(column, errors='coerce')
+        wrong  = parsed.isna() & column.notna()
+        name, value = names[wrong].iat[0], column[wrong].iat[0]
+        raise ValueError(msg % (key, name, value))
+    # Check there are no decimals #
+    wrong = values.notna() & (values % 1 != 0)
+    if wrong.any():
+        name, value = names[wrong].iat[0], column[wrong].iat[0]
+        raise ValueError(msg % (key, name, value))
+    # Convert the whole column, now that the used rows are known to be valid #
+    values = pandas.to_numeric(df[key], errors='coerce')
+    values = values.where((values % 1 == 0).fillna(False))
+    # Return #
+    return values.astype('Int64')
+
+def append_file(path, out):
+    """
+    Append the contents of the file at `path` to the opened binary file
+    handle `out`. On Linux, `os.sendfile` copies the bytes inside the
+    kernel. Elsewhere, or if it fails, we copy with a large buffer.
+    """
+    with open(path, 'rb') as src:
+        # Flush anything buffered before writing to the descriptor #
+        out.flush()
+        # Try the zero-copy method first #
+        size, offset = os.fstat(src.fileno()).st_size, 0
+        try:
+            while offset < size:
+                sent = os.sendfile(out.fileno(), src.fileno(), offset,
+                                   size - offset)
+                if sent == 0: break
+                offset += sent
+        # Fall back to copying through python #
+        except (OSError, AttributeError):
+            src.seek(offset)
+            shutil.copyfileobj(src, out, 1 << 20)
+
+def copy_into(path, fd, offset):
+    """
+    Copy the whole file at `path` into the opened file descriptor `fd`,
+    starting at byte `offset` of the destination. The bytes are copied
+    inside the kernel and the position of `fd` is not used, so several
+    files can be copied into the same destination at the same time.
+    """
+    with open(path, 'rb') as src:
+        size, done = os.fstat(src.fileno()).st_size, 0
+        while done < size:
+            sent = os.copy_file_range(src.fileno(), fd, size - done,
+                                      done, offset + done)
+            if sent == 0: raise OSError("Unexpected end of '%s'." % path)
+            done += sent
+
+def concat_files(inputs, dest, threads=8):
+    """
+    Concatenate all the files in `inputs` into the file `dest`.
+    On Linux, the destination is sized beforehand and every input is
+    copied into its own region of it in parallel. Elsewhere, or if that
+    fails, the inputs are appended one after the other.
+    """
+    # Every input starts where the previous one ends #
+    sizes   = [os.path.getsize(path) for path in inputs]
+    offsets = list(itertools.accumulate(sizes, initial=0))[:-1]
+    # Try the parallel method first #
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            os.ftruncate(fd, sum(sizes))
+            fds = [fd] * len(inputs)
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(copy_into, inputs, fds, offsets))
+        finally:
+            os.close(fd)
+    # Fall back to appending one by one #
+    except (OSError, AttributeError):
+        with open(dest, 'wb', buffering=1 << 22) as out:
+            for path in inputs: append_file(path, out)
+
+###############################################################################
+class property_metadata(property_cached):
+    """
+    Same as `property_cached` but marks the properties of a Project that
+    are derived from its excel files. These are the ones discarded by the
+    `Project.refresh` method when the files change.
+    """
+
+###############################################################################
+class SampleList(collections.abc.Sequence):
+    """
+    Behaves like a list of Sample objects, except that each Sample is only
+    created the first time it is accessed. Hence, taking the length of a
+    project or looking at its first sample is fast even when the project
+    contains hundreds of samples.
+    """
+
+    def __repr__(self):
+        return '<%s object with %i samples>' % (self.__class__.__name__,
+                                                len(self))
+
+    def __init__(self, project, records):
+        # Keep the metadata rows, one dictionary per sample #
+        self.project = project
+        self.records = records
+        # The Sample objects created so far, keyed by index #
+        self.created = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        # Slices return a real list #
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        # Negative indices count from the end #
+        if index < 0: index += len(self)
+        if not 0 <= index < len(self): raise IndexError(index)
+        # Create the sample only once #
+        if index not in self.created:
+            from pacmill.core.sample import Sample
+            row = self.records[index]
+            self.created[index] = Sample(self.project, **row)
+        # Return #
+        return self.created[index]
+
+    def __iter__(self):
+        for i in range(len(self)): yield self[i]
 
 ###############################################################################
 class Project:
@@ -53,7 +263,7 @@ class Project:
             * self.all_xlsx:   a list of file paths (that are excel files).
             * self.metadata:   a pandas dataframe with all metadata
                                for this project combined.
-            * self.samples:    a list of Sample objects.
+            * self.samples:    a list of Sample objects, created lazily.
 
         Other properties are described in their respective docstrings.
         """
@@ -70,53 +280,184 @@ class Project:
         assert len(all_xlsx) > 0
         # Save all excel file paths as Paths objects #
         self.all_xlsx = list(map(Path, all_xlsx))
-        # Check all the excel paths actually exist #
-        for path in self.all_xlsx:
-            if not path.exists:
-                msg = "The excel file at '%s' does not exist."
-                raise Exception(msg % path)
+        # Remember the state of the excel files we are going to read #
+        # This also checks that they all exist
+        self.fingerprint = self.xlsx_fingerprint()
 
     #----------------------------- Properties --------------------------------#
-    @property_cached
+    @property_metadata
     def metadata(self):
         """
         Return a pandas.DataFrame object describing the metadata of all
         samples contained in this project.
+        The result is cached in the Feather format and reused as long as
+        the excel files are not modified.
         """
-        # Function to read one excel file #
-        # Any empty cell causes the conversion to integers to fail, so let's
-        # just not use it at all and do it later ourselves manually
-        def read_excel(path):
-            return pandas.read_excel(str(path), header=1, convert_float=False)
-        # Read all excel files as data frames #
-        all_dfs = [read_excel(path) for path in self.all_xlsx]
+        # Use the binary cache if we made one already for these files #
+        # A cache that can't be read for any reason is simply made again
+        cache = self.metadata_cache
+        if cache.exists:
+            try: return pandas.read_feather(cache.path)
+            except Exception: pass
+        # Read all excel files as data frames, several at the same time #
+        # openpyxl builds every cell in pure python and holds the GIL, so
+        # threads would not help, each file is read by its own process
+        jobs = [(str(path), self.short_name) for path in self.all_xlsx]
+        if len(jobs) == 1: all_dfs = [read_project_rows(jobs[0])]
+        else:
+            # Forking could deadlock if threads were started #
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(min(8, len(jobs))) as pool:
+                all_dfs = pool.map(read_project_rows, jobs)
         # If there are several excel files, merge them together #
-        metadata = pandas.concat(all_dfs, sort=False)
-        # Check the proj short names are only lower case #
-        if not all(metadata.project_short_name.str.islower()):
-            msg = "The short name of a project can only contain " \
-                  "alphanumerical characters and underscores."    \
-                  "Also it cannot contain upper case characters."
-            raise ValueError(msg)
-        # Filter and take only samples that match this project's short_name #
-        query = f'project_short_name == "{self.short_name}"'
-        metadata = metadata.query(query).copy()
+        metadata = pandas.concat(all_dfs, sort=False, ignore_index=True)
+        # Text columns use the dedicated string type instead of objects #
+        metadata = metadata.convert_dtypes(convert_integer  = False,
+                                           convert_boolean  = False,
+                                           convert_floating = False)
+        # These columns only take a few distinct values #
+        categories = ['project_short_name', 'used', 'grouping']
+        categories = {c: 'category' for c in categories
+                      if c in metadata.columns}
+        metadata = metadata.astype(categories)
+        # Integer columns with empty cells were read as floats, use the
+        # nullable integer type instead. Only the rows of samples that are
+        # used are checked, a note left in another row is not an error
+        from pacmill.core.sample import Sample
+        used = metadata['used'].values == 'yes'
+        for key in Sample.int_keys:
+            if key not in metadata.columns: continue
+            metadata[key] = to_integers(metadata, key, used)
+        # Store the binary cache, if `pyarrow` is installed #
+        # The cache is optional, failing to write it is never an error
+        try: self.save_metadata_cache(metadata, cache)
+        except Exception: pass
         # Return #
         return metadata
 
-    @property_cached
+    # Where the binary caches of metadata are stored #
+    # Every set of excel files of a project gets its own sub-directory
+    cache_dir = DirectoryPath(os.path.join(os.environ.get('XDG_CACHE_HOME')
+                                           or '~/.cache', 'pacmill') + '/')
+
+    # Increment this when the way the metadata is parsed changes #
+    # The caches made by older versions of the code are then ignored
+    cache_version = 3
+
+    @property_metadata
+    def metadata_cache(self):
+        """
+        The path to the Feather file caching the metadata of this project.
+        It is placed in a directory named after the project's short name
+        and a hash of the absolute paths of its excel files, so that other
+        projects with the same short name don't share it. The name of the
+        file is a hash of the format version along with the modification
+        time and size of every excel file. Hence, editing any excel file or
+        changing the parsing code produces a new cache.
+        """
+        # Hash a string #
+        digest = lambda key: hashlib.blake2b(key.encode(),
+                                             digest_size=16).hexdigest()
+        # The directory depends on where the excel files are #
+        paths = [os.path.abspath(os.path.expanduser(path))
+                 for path, mtime, size in self.fingerprint]
+        directory = '%s-%s/' % (self.short_name, digest('|'.join(paths)))
+        # The file depends on their contents #
+        key = 'v%i' % self.cache_version
+        for path, mtime, size in self.fingerprint:
+            key += '|%s:%i:%i' % (path, mtime, size)
+        # Return #
+        return self.cache_dir + directory + 'metadata-%s.feather' % digest(key)
+
+    def save_metadata_cache(self, metadata, cache):
+        """
+        Write the `metadata` to the Feather file `cache` and delete the
+        other caches of this project, which are all out of date.
+        """
+        # Write the new one #
+        cache.directory.create_if_not_exists()
+        save_atomically(metadata.to_feather, cache)
+        # Remove the old ones #
+        for name in os.listdir(cache.directory.path):
+            if name == cache.filename: continue
+            if not name.startswith('metadata-'): continue
+            if name.endswith('.tmp'): continue
+            os.remove(os.path.join(cache.directory.path, name))
+
+    @property_metadata
+    def metadata_columns(self):
+        """
+        A dictionary of the metadata columns that were read on their own
+        by the `metadata_column` method, keyed by column name.
+        """
+        return {}
+
+    def metadata_column(self, name):
+        """
+        Return the column `name` of the metadata for the samples that are
+        used in this project as a pandas.Series, or None if no such column
+        exists. When the full metadata is not loaded yet, only the columns
+        needed are read from the binary cache, if it is available.
+        """
+        # Check if we did this one already #
+        if name in self.metadata_columns: return self.metadata_columns[name]
+        # Try reading only the needed columns from the binary cache #
+        if 'metadata' in getattr(self, '__cache__', {}): df = None
+        else: df = self.read_used_columns(['used', name])
+        # Otherwise, use the full metadata #
+        if df is None:
+            df = self.metadata
+            df = df.loc[df['used'].values == 'yes']
+        # Check the column exists #
+        column = df[name] if name in df.columns else None
+        # Return #
+        self.metadata_columns[name] = column
+        return column
+
+    def read_used_columns(self, columns):
+        """
+        Read only the given `columns` of the metadata from the binary cache
+        without parsing any excel file, keeping only the rows of samples
+        that are used in this project. If the cache is missing or can't be
+        read, None is returned instead.
+        """
+        cache = self.metadata_cache
+        if not cache.exists: return None
+        try: df = pandas.read_feather(cache.path, columns=columns)
+        except Exception: return None
+        return df.loc[df['used'].values == 'yes']
+
+    @property_metadata
     def samples(self):
-        """Create all the Sample objects."""
+        """All the Sample objects, each one created when first accessed."""
         # Remove samples that are not marked as "yes" for "used" #
-        metadata = self.metadata.query('used == "yes"').copy()
-        # Iterate over all rows of the input #
-        rows = metadata.iterrows()
-        # Import object #
+        metadata = self.metadata
+        metadata = metadata.loc[metadata['used'].values == 'yes']
+        # Check all sample names contain only alphanumerics and underscore #
+        names = metadata['sample_short_name'].astype(str)
+        wrong = ~names.str.fullmatch(valid_name)
+        if wrong.any():
+            msg = "The short name of a sample can only contain " \
+                  "alphanumerical characters and underscores. " \
+                  "The following ones are invalid:\n %s"
+            raise ValueError(msg % names[wrong].tolist())
+        # Check that all directories always end with a dash (/) #
+        dir_keys = [key for key in metadata.columns if key.endswith('_dir')]
+        for key in dir_keys:
+            values = metadata[key]
+            wrong  = values.isna() | ~values.astype(str).str.endswith('/')
+            if wrong.any():
+                msg = "The `%s` entry of sample '%s' must end with a " \
+                      "slash. It currently does not: '%s'"
+                name, value = names[wrong].iat[0], values[wrong].iat[0]
+                raise ValueError(msg % (key, name, value))
+        # Clean the values of all samples at once #
         from pacmill.core.sample import Sample
-        # Make one Sample object per row #
-        samples = [Sample(self, **dict(row)) for i, row in rows]
-        # Add a reference to the current project #
-        for sample in samples: sample.parent = self
+        metadata = Sample.preprocess_dataframe(metadata)
+        # Convert all rows to dictionaries at once #
+        records = to_records(metadata)
+        # Sample objects are made from each row only when needed #
+        samples = SampleList(self, records)
         # Check we have at least one sample #
         if not len(samples) > 0:
             msg = "No samples belonging to the project '%s' were found in" \
@@ -125,17 +466,21 @@ class Project:
         # Return #
         return samples
 
-    @property_cached
+    @property_metadata
     def long_name(self):
         """
         Get the project's long name which is a string describing the
         project title in a longer fashion than the short name.
+        It is read from the metadata without creating any Sample objects.
         """
         return self.check_homogeneous('project_long_name')
 
-    @property_cached
+    @property_metadata
     def output_dir(self):
-        """Get the project's output directory."""
+        """
+        Get the project's output directory.
+        It is read from the metadata without creating any Sample objects.
+        """
         return DirectoryPath(self.check_homogeneous('output_dir'))
 
     #-------------------------- Automatic paths ------------------------------#
@@ -153,33 +498,100 @@ class Project:
                 /log.txt
                 """
 
-    @property_cached
+    @property_metadata
     def autopaths(self):
         """
         The AutoPaths object is used for quickly assessing the filesystem paths
         of various file inputs/outputs and directories.
         See https://github.com/xapple/autopaths#autopaths-object
+        Each path is only searched for once and then remembered.
         """
-        from autopaths.auto_paths import AutoPaths
-        return AutoPaths(self.output_dir, self.all_paths)
+        from pacmill.core.auto_paths import CachedAutoPaths
+        return CachedAutoPaths(self.output_dir, self.all_paths)
 
     #------------------------------- Methods ---------------------------------#
+    def xlsx_fingerprint(self):
+        """
+        Return a tuple with the path, modification time and size of every
+        excel file. It changes as soon as any of the files is edited.
+        Every file is looked at only once, and if some of them don't exist
+        they are all reported in the same message.
+        """
+        # Collect the information on every file #
+        fingerprint, missing = [], []
+        for path in self.all_xlsx:
+            try: stat = os.stat(path)
+            except FileNotFoundError:
+                missing.append(str(path))
+                continue
+            fingerprint.append((str(path), stat.st_mtime_ns, stat.st_size))
+        # Report all the missing ones #
+        if missing:
+            msg = "The following excel files do not exist:\n %s"
+            raise Exception(msg % '\n '.join(missing))
+        # Return #
+        return tuple(fingerprint)
+
+    def refresh(self, force=False):
+        """
+        Discard the cached properties that are derived from the excel files,
+        such as the metadata and the samples, if any of the files changed
+        since they were read. Use `force=True` to discard them in any case.
+        Other cached properties, such as the OTUs, are kept, along with
+        the Sample objects they were made with.
+        The files are only checked when this method is called, for instance
+        after editing them in an interactive session, and not every time
+        a property is accessed.
+        Returns True if the cached properties were discarded.
+        """
+        # Check if anything changed #
+        current = self.xlsx_fingerprint()
+        if not force and current == self.fingerprint: return False
+        # Purge only the properties that depend on the excel files #
+        cache = self.__dict__.get('__cache__', {})
+        for cls in type(self).__mro__:
+            for name, attr in vars(cls).items():
+                if isinstance(attr, property_metadata): cache.pop(name, None)
+        self.fingerprint = current
+        # Return #
+        return True
+
     def check_homogeneous(self, attribute):
         """
         This method will check every Sample of the current project for a
         specific attribute (e.g. 'output_dir') and assert that this attribute
         has the same value in every Sample. If this is the case, the unique
         value is returned. Otherwise an Exception is raised.
+        When the attribute is a column of the metadata, the column is checked
+        directly without needing to create any Sample object, and often
+        without needing to load the full metadata either.
         """
-        # Collect all values #
-        all_values = set(getattr(s, attribute) for s in self)
+        # The message in case of error #
+        msg = "The attribute '%s' is not uniform across samples." \
+              " Current values are:\n %s"
+        # Get the column, only for samples that are used #
+        column = self.metadata_column(attribute)
+        # Attributes that are not in the metadata come from the samples #
+        if column is None:
+            # Compare every sample to the first one #
+            first = getattr(self.samples[0], attribute)
+            for sample in self.samples[1:]:
+                # Stop at the first difference #
+                if getattr(sample, attribute) != first:
+                    all_values = set(getattr(s, attribute) for s in self)
+                    raise ValueError(msg % (attribute, all_values))
+            # Return the unique value for convenience #
+            return first
         # Check that it doesn't diverge between samples #
-        if not len(all_values) == 1:
-            msg = "The attribute '%s' is not uniform across samples." \
-                  " Current values are:\n %s"
-            raise ValueError(msg % (attribute, all_values))
-        # Return the unique value for convenience #
-        return all_values.pop()
+        values = column.unique()
+        if len(values) != 1:
+            raise ValueError(msg % (attribute, set(values)))
+        # Get the unique value #
+        value = values[0]
+        # Missing values should be None and not pandas.nan #
+        if pandas.isna(value): return None
+        # Return a python object instead of a numpy scalar #
+        return value.item() if hasattr(value, 'item') else value
 
     def combine_reads(self, verbose=True, check=False):
         """
@@ -193,11 +605,8 @@ class Project:
             print(msg)
         # Get all input paths #
         inputs = [sample.final for sample in self]
-        # Make the command to be run #
-        cmd = 'cat %s > %s' % (' '.join(inputs), self.fasta)
-        # We don't want python to be buffering the text for speed #
-        from shell_command import shell_output
-        shell_output(cmd)
+        # Concatenate them without spawning a shell #
+        concat_files(inputs, self.fasta)
         # Sanity check the total #
         if check:
             before = sum(len(s.chimeras.results) for s in self)
@@ -10,7 +10,6 @@ Contact at www.sinclair.bio
 # Built-in modules #
 
 # Third party modules #
-import pandas
 
 # First party modules #
 from plumbing.cache import property_cached
@@ -18,6 +17,26 @@ from autopaths      import Path
 
 # Internal modules #
 
+###############################################################################
+def build_fastq(path, fastqc_dir, len_dist_pdf, len_hist_pdf):
+    """
+    Return a FASTQ object for the file at `path` with its FastQC report and
+    its length distribution graphs relocated to the given paths. We don't
+    want to touch the directory where the original reads are stored on the
+    file system. We might simply not have permission to write there.
+    """
+    # Imports #
+    from fasta import FASTQ
+    from fasta.fastqc import FastQC
+    # Make the object #
+    fastq = FASTQ(path)
+    fastq.fastqc = FastQC(fastq, fastqc_dir)
+    # The graphs are only resolved once #
+    graphs = fastq.graphs
+    graphs.length_dist.path = len_dist_pdf
+    graphs.length_hist.path = len_hist_pdf
+    return fastq
+
 ###############################################################################
 class Sample:
     """
@@ -60,9 +79,11 @@ class Sample:
         self.parent  = parent
         self.project = parent
         # Record which metadata keys were passed to this sample #
-        self.metadata_keys = [k for k in kwargs if not k.startswith("Unnamed")]
+        # The empty "Unnamed" columns were already removed by the Project
+        self.metadata_keys = list(kwargs)
         # Set the attributes of this instance with the given kwargs #
-        for key in self.metadata_keys: setattr(self, key, kwargs[key])
+        # Updating the dictionary directly is faster than calling setattr
+        self.__dict__.update(kwargs)
         # We need to transform some attributes #
         self.transform_attrs()
         # We need to validate some attributes #
@@ -74,6 +95,8 @@ class Sample:
     dna_keys = ['fwd_index_seq', 'rev_index_seq', 'fwd_primer_seq',
                 'rev_primer_seq']
 
+    barrnap_modes = frozenset(('off', 'filter', 'concat', 'trim'))
+
     int_keys = ['sample_num', 'fwd_read_count', 'rev_read_count', 'fwd_read_len', 'rev_read_len', 'primer_mismatches', 'primer_max_dist', 'min_read_len', 'max_read_len', 'phred_window_size', 'phred_threshold', 'otu_min_size', 'max_taxa']
 
     def transform_attrs(self):
@@ -87,51 +110,58 @@ class Sample:
         self.long_name = self.sample_long_name
         # The sample number can just be called num #
         self.num = int(self.sample_num)
-        # Missing values should be None and not pandas.nan #
-        for key in self.metadata_keys:
-            if pandas.isna(getattr(self, key)): setattr(self, key, None)
+        # The other values were already cleaned by `preprocess_dataframe` #
+
+    @classmethod
+    def preprocess_dataframe(cls, df):
+        """
+        Given the metadata of several samples as a pandas.DataFrame, return
+        a new DataFrame with the values cleaned for all samples at once,
+        column by column, instead of one sample at a time:
+
+        * Spaces in any DNA sequence are removed.
+        * Missing values become None and not pandas.nan.
+
+        The values that are supposed to be integers were already converted
+        by the Project when it read the metadata.
+        """
+        # Only needed here #
+        import pandas
+        # Don't modify the original #
+        df = df.copy()
         # If there are spaces in any DNA sequence, remove them #
-        for key in self.dna_keys:
-            seq = getattr(self, key)
-            if seq: setattr(self, key, seq.replace(' ', ''))
-        # Convert all values that are supposed to be integers
-        for key in self.int_keys:
-            value = getattr(self, key, None)
-            if value is not None: setattr(self, key, int(value))
+        for key in cls.dna_keys:
+            if key not in df.columns: continue
+            if not pandas.api.types.is_string_dtype(df[key]): continue
+            df[key] = df[key].str.replace(' ', '', regex=False)
+        # Missing values should be None and not pandas.nan #
+        df = df.astype(object).where(df.notna(), None)
+        # Return #
+        return df
 
     def validate_attrs(self):
         """
         This is where we check that the information in the excel
         metadata file is consistent and usable.
         """
-        # Check the short name contains only alphanumerics and underscore #
-        assert self.short_name.isidentifier()
-        # Check that all directories always end with a dash (/) #
-        for key in self.metadata_keys:
-            if not key.endswith('_dir'): continue
-            value = getattr(self, key)
-            if not isinstance(value, str) or not value.endswith("/"):
-                msg = "The `%s` entry of <%s> must end with a slash. " \
-                      "It currently does not: '%s'"
-                msg = msg % (key, self.description, value)
-                raise ValueError(msg)
-        # Check that the FASTQ file exists #
-        if not self.path.exists:
-            msg = "The FASTQ file path of <%s> cannot be found. " \
-                  "It should be located at: '%s'"
-            msg = msg % (self.description, self.path)
-            raise FileNotFoundError(msg)
+        # The short names and the directories are checked all at once
+        # for every sample by the Project object
+        # The metadata values are read directly from the instance dictionary
+        attrs = self.__dict__
         # Check the DNA sequences are properly formatted #
-        for key in self.dna_keys:
-            seq = getattr(self, key)
-            if seq and '\n' in seq:
-                msg = "The `%s` entry of <%s> contains illegal " \
-                      "characters, please check: '%s'"
-                msg = msg % (key, self.description, seq)
-                raise ValueError(msg)
+        # All sequences are scanned at once and only looked at one by one
+        # if something is wrong, to find which one it is
+        seqs = [attrs.get(key) or '' for key in self.dna_keys]
+        if '\n' in ''.join(seqs):
+            key, seq = next((k, s) for k, s in zip(self.dna_keys, seqs)
+                            if '\n' in s)
+            msg = "The `%s` entry of <%s> contains illegal " \
+                  "characters, please check: '%s'"
+            msg = msg % (key, self.description, seq)
+            raise ValueError(msg)
         # Check that the barrnap mode is a valid option #
-        if hasattr(self, 'barrnap_mode'):
-            assert self.barrnap_mode in ['off', 'filter', 'concat', 'trim']
+        if 'barrnap_mode' in attrs:
+            assert attrs['barrnap_mode'] in self.barrnap_modes
 
     # Declare the default values #
     defaults = {
@@ -152,8 +182,10 @@ class Sample:
         we will add that particular attribute to the current instance.
         """
         # Check everyone of them #
-        for key, value in self.defaults.items():
-            if not hasattr(self, key): setattr(self, key, value)
+        # Writing to the instance dictionary avoids one attribute
+        # lookup and one setattr call per key
+        attrs = self.__dict__
+        for key, value in self.defaults.items(): attrs.setdefault(key, value)
 
     #----------------------------- Properties --------------------------------#
     @property
@@ -202,9 +234,10 @@ class Sample:
         The AutoPaths object is used for quickly assessing the filesystem paths
         of various file inputs/outputs and directories.
         See https://github.com/xapple/autopaths#autopaths-object
+        Each path is only searched for once and then remembered.
         """
-        from autopaths.auto_paths import AutoPaths
-        return AutoPaths(self.base_dir, self.all_paths)
+        from pacmill.core.auto_paths import CachedAutoPaths
+        return CachedAutoPaths(self.base_dir, self.all_paths)
 
     #---------------------------- Compositions -------------------------------#
     @property_cached
@@ -212,20 +245,20 @@ class Sample:
         """
         The raw reads FASTQ object with convenience methods.
         See https://github.com/xapple/fasta#usage
+        The existence of the file is checked here and not when the sample
+        is created, to avoid one filesystem access per sample up front.
         """
+        # Check that the FASTQ file exists #
+        if not self.path.exists:
+            msg = "The FASTQ file path of <%s> cannot be found. " \
+                  "It should be located at: '%s'"
+            msg = msg % (self.description, self.path)
+            raise FileNotFoundError(msg)
         # This class is taken from the `fasta` python package #
-        from fasta import FASTQ
-        fastq = FASTQ(self.path)
-        # Change the location of the first FastQC, as we don't want to touch
-        # the directory where the original reads are stored on the file system.
-        # We might simply not have permission to write there.
-        from fasta.fastqc import FastQC
-        fastq.fastqc = FastQC(fastq, self.autopaths.fastqc_dir)
-        # Change the location of the length distribution graphs too #
-        fastq.graphs.length_dist.path = self.autopaths.len_dist_pdf
-        fastq.graphs.length_hist.path = self.autopaths.len_hist_pdf
-        # Return #
-        return fastq
+        # The FastQC and graph outputs are moved to our own directory
+        paths = self.autopaths
+        return build_fastq(self.path, paths.fastqc_dir,
+                           paths.len_dist_pdf, paths.len_hist_pdf)
 
     @property_cached
     def primers(self):
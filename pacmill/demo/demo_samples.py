@@ -47,6 +47,7 @@ The five samples used in the demo project are described as follows:
 """
 
 # Built-in modules #
+import os, glob, shutil
 
 # First-party modules #
 from autopaths.file_path import FilePath
@@ -56,6 +57,71 @@ from plumbing.scraping import download_from_url
 # Internal modules #
 from pacmill import repos_dir
 
+# Third party modules #
+import requests
+
+# Constants #
+timeout = 60 # Seconds to wait for the server before giving up
+
+###############################################################################
+def download_part(url, part_path, start, end, chunk_size=1 << 20):
+    """
+    Download the bytes from `start` to `end` (inclusive) of the resource at
+    `url` and append them to the file at `part_path`. If that file already
+    contains some bytes, only the missing ones are requested.
+    """
+    # Check how much we already have #
+    done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if start + done > end: return
+    # Request only the remaining range #
+    headers = {'Range': 'bytes=%i-%i' % (start + done, end)}
+    with requests.get(url, headers=headers, stream=True,
+                      timeout=timeout) as response:
+        response.raise_for_status()
+        # The server must honor the range or we would corrupt the file #
+        if response.status_code != 206:
+            raise Exception("The server ignored the range request.")
+        with open(part_path, 'ab') as handle:
+            for data in response.iter_content(chunk_size=chunk_size):
+                handle.write(data)
+
+def download_in_parts(url, destination, parts=4):
+    """
+    Download the resource at `url` to `destination` using `parts`
+    connections at the same time, each one fetching a different byte range
+    into its own file. Running this function again after an interruption
+    resumes every part where it stopped. Returns None if the server
+    doesn't support range requests, so that the caller can fall back
+    to a simple download. If the destination already exists with the
+    right size, nothing is downloaded.
+    """
+    # Get the total size #
+    head  = requests.head(url, allow_redirects=True, timeout=timeout)
+    total = int(head.headers.get('content-length', -1))
+    # Maybe we are already done #
+    destination = FilePath(destination)
+    if total > 0 and destination.exists and destination.count_bytes == total:
+        return destination
+    # Check that ranges are accepted #
+    if total <= 0 or head.headers.get('accept-ranges') != 'bytes': return None
+    # Split the file in ranges #
+    bounds = [total * i // parts for i in range(parts + 1)]
+    ranges = [(bounds[i], bounds[i+1] - 1) for i in range(parts)]
+    paths  = [destination.path + '.part%i' % i for i in range(parts)]
+    # Download all parts at the same time #
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=parts) as executor:
+        jobs = [executor.submit(download_part, url, path, start, end)
+                for path, (start, end) in zip(paths, ranges)]
+        for job in jobs: job.result()
+    # Join them together #
+    with open(destination, 'wb') as handle:
+        for path in paths:
+            with open(path, 'rb') as part: shutil.copyfileobj(part, handle)
+    for path in paths: os.remove(path)
+    # Return #
+    return destination
+
 ###############################################################################
 class DemoSample:
     """
@@ -90,14 +156,37 @@ class DemoSample:
         self.download()
         self.extract()
 
-    def download(self):
-        """Will download the SRA file from the internet."""
+    def download(self, progress=True, force=False):
+        """
+        Will download the SRA file from the internet. If the server allows
+        it, the file is downloaded in several parts at the same time, and
+        an interrupted download is resumed where it stopped.
+        A file that is already complete is not downloaded again,
+        unless `force` is True.
+        """
+        # Start from scratch if asked to #
+        # The parts of an interrupted download would otherwise be resumed
+        if force:
+            parts = glob.glob(glob.escape(self.path_sra.path) + '.part*')
+            for path in [self.path_sra.path] + parts:
+                try: os.unlink(path)
+                except FileNotFoundError: pass
+        # Try the parallel and resumable method first #
+        path = download_in_parts(self.url, self.path_sra)
+        if path is not None: return path
+        # Otherwise use a simple download #
         return download_from_url(self.url, self.path_sra,
-                                 stream=True, progress=True)
+                                 stream=True, progress=progress)
 
-    def extract(self):
-        """Will extract the FASTQ file from the SRA file."""
-        return self.sra_dump()
+    def extract(self, cpus=None, force=False, configure=True):
+        """
+        Will extract the FASTQ file from the SRA file. The number of
+        processors used for compressing the output can be specified.
+        Nothing is done if the FASTQ file was already extracted,
+        unless `force` is True. See `DumpSRA` for `configure`.
+        """
+        if self.extracted and not force: return self.path_fastq
+        return self.sra_dump(cpus=cpus, configure=configure)
 
     #----------------------------- Properties --------------------------------#
     @property
@@ -106,10 +195,23 @@ class DemoSample:
         desc = "Demo sample object %i with name '%s'"
         return desc % (self.num, self.short_name)
 
+    @property
+    def extracted(self):
+        """
+        Is the compressed FASTQ file already present? We only check that
+        it is not empty and starts with the gzip magic number.
+        """
+        if not self.path_fastq.exists: return False
+        with open(self.path_fastq, 'rb') as handle:
+            return handle.read(2) == b'\x1f\x8b'
+
     @property_cached
     def path_fastq(self):
-        """The path to the raw FASTQ reads file."""
-        return FilePath(self.base_dir + self.short_name + '.fastq')
+        """
+        The path to the raw FASTQ reads file. It is compressed directly
+        while being extracted from the SRA file.
+        """
+        return FilePath(self.base_dir + self.short_name + '.fastq.gz')
 
     @property_cached
     def path_sra(self):
@@ -119,7 +221,7 @@ class DemoSample:
     #---------------------------- Compositions -------------------------------#
     @property_cached
     def sra_dump(self):
-        """Takes care of running `fastq-dump` to extract sequences."""
+        """Takes care of running `fasterq-dump` to extract sequences."""
         # Create filter object #
         from pacmill.demo.sra import DumpSRA
         sra_dump = DumpSRA(self.path_sra, self.path_fastq)
@@ -140,7 +242,7 @@ class DemoSample:
 
 ###############################################################################
 # Hardcode the download links #
-samples = {
+sample_urls = {
     'mock':   'https://sra-download.ncbi.nlm.nih.gov/traces/sra60/SRR/007923/'
               'SRR8113901',
     'p_19':   'https://sra-download.ncbi.nlm.nih.gov/traces/sra60/SRR/007923/'
@@ -153,5 +255,17 @@ samples = {
               'sra-pub-run-15/SRR8113899/SRR8113899.1',
 }
 
-# Make DemoSample objects #
-samples = [DemoSample(k, i+1, v) for i, (k, v) in enumerate(samples.items())]
\ No newline at end of file
+# Make DemoSample objects only when they are first asked for #
+def __getattr__(name):
+    """
+    The `samples` list is built the first time it is accessed, and not when
+    this module is imported. It is then stored in the module like any
+    other global variable.
+    """
+    if name != 'samples':
+        msg = "module '%s' has no attribute '%s'"
+        raise AttributeError(msg % (__name__, name))
+    items   = enumerate(sample_urls.items())
+    samples = [DemoSample(k, i+1, v) for i, (k, v) in items]
+    globals()['samples'] = samples
+    return samples
\ No newline at end of file
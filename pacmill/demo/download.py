@@ -15,11 +15,34 @@ Typically you would run this file from a command line like this:
 """
 
 # Built-in modules #
+import os, multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 
 # Internal modules #
 
 # Constants #
 
+###############################################################################
+def process(sample, cpus=None):
+    """
+    Download, extract and clean up a single sample. Each sample goes
+    through all its stages independently of the others, so that one
+    sample can be extracted while another one is still downloading.
+    Samples that were already extracted in a previous run are skipped.
+    The `vdb_config_workaround` of `DumpSRA` must have been run before.
+    """
+    # Maybe we are already done #
+    if sample.extracted: return sample.path_fastq
+    # Progress bars would be mixed together so we don't show them #
+    sample.download(progress=False)
+    # Extract, the FASTQ file is compressed at the same time #
+    sample.extract(cpus=cpus, configure=False)
+    # Remove the sra archive, without checking that it exists first #
+    try: os.unlink(sample.path_sra)
+    except FileNotFoundError: pass
+    # Return #
+    return sample.path_fastq
+
 ###############################################################################
 if __name__ == "__main__":
     # Import #
@@ -27,19 +50,17 @@ if __name__ == "__main__":
     # Check we have the required program for uncompressing first #
     from pacmill.demo.sra import DumpSRA
     DumpSRA.check_installed()
+    # Write the configuration once, not from every thread at the same time #
+    DumpSRA.vdb_config_workaround()
     # Message #
     print("\n Downloading the 5 demo samples which are:")
     texts = (sample.description for sample in samples)
     print('\n  * ' + '\n  * '.join(texts), '\n')
     print("This will take a few minutes.")
-    # Download #
-    for sample in samples: print(sample.download())
-    # Extract #
-    for sample in samples: print(sample.extract())
-    # Compress #
-    print("Compressing all FASTQ files.")
-    for sample in samples: print(sample.fastq.compress(remove_orig=True))
-    # Remove the sra archive #
-    for sample in samples: sample.path_sra.remove()
+    # Process all samples at the same time, sharing the processors #
+    cpus = max(1, multiprocessing.cpu_count() // len(samples))
+    with ThreadPoolExecutor(max_workers=len(samples)) as executor:
+        jobs = [executor.submit(process, s, cpus) for s in samples]
+        for job in jobs: print(job.result())
     # Success #
     print("Done. Results are in '%s'." % samples[0].base_dir)
@@ -8,7 +8,8 @@ Contact at www.sinclair.bio
 """
 
 # Built-in modules #
-import uuid
+import os, uuid, shutil, multiprocessing
+from subprocess import Popen, PIPE
 
 # First party modules #
 from fasta import FASTQ
@@ -24,8 +25,9 @@ import sh
 ###############################################################################
 class DumpSRA:
     """
-    Takes care of running the `sra-toolkit` program to extract a FASTQ from
-    an SRA file. See:
+    Takes care of running the `fasterq-dump` program of the `sra-toolkit`
+    to extract a FASTQ from an SRA file. Unlike the older `fastq-dump`,
+    it uses several threads. See:
     https://trace.ncbi.nlm.nih.gov/Traces/sra/sra.cgi?view=software
 
     Until Ubuntu 19, `sra-toolkit` was a package in the apt universe. This
@@ -45,8 +47,9 @@ class DumpSRA:
         self.dest = FASTQ(dest)
 
     #---------------------------- Installing ---------------------------------#
-    url = "https://ftp-trace.ncbi.nlm.nih.gov/sra/sdk/2.10.8/" \
-          "sratoolkit.2.10.8-ubuntu64.tar.gz"
+    version = "3.0.10"
+    url = "https://ftp-trace.ncbi.nlm.nih.gov/sra/sdk/%s/" \
+          "sratoolkit.%s-ubuntu64.tar.gz" % (version, version)
 
     @classmethod
     def check_installed(cls, exception=True):
@@ -54,7 +57,7 @@ class DumpSRA:
         Try to determine if the `sra-toolkit` software is installed and
         accessible.
         """
-        return check_cmd('fastq-dump', exception, cls.install.__doc__)
+        return check_cmd('fasterq-dump', exception, cls.install.__doc__)
 
     @classmethod
     def install(cls, prefix="~/programs/sra-toolkit/"):
@@ -100,24 +103,57 @@ class DumpSRA:
         ncbi_settings.write('/LIBS/GUID = "%s"\n' % new_guid)
 
     #------------------------------ Running ----------------------------------#
-    def __call__(self, cpus=None, verbose=True):
+    def __call__(self, cpus=None, verbose=True, configure=True):
+        """
+        Pass `configure=False` when the `vdb_config_workaround` was already
+        run once before starting several extractions at the same time.
+        """
         # Message #
-        if verbose: print("Running fastq-dump on '%s'" % self.source)
+        if verbose: print("Running fasterq-dump on '%s'" % self.source)
         # Check it is installed #
         self.check_installed()
         # Some questionable change they did in recent versions #
-        self.vdb_config_workaround()
+        if configure: self.vdb_config_workaround()
         # Get the command #
-        dump = sh.Command("fastq-dump")
+        dump = sh.Command("fasterq-dump")
         # Check version #
-        assert "2.10.8" in dump('--version')
-        # Make a temporary directory #
+        assert self.version in dump('--version')
+        # Number of processors #
+        if cpus is None: cpus = min(multiprocessing.cpu_count(), 32)
+        # More than 8 threads brings almost nothing according to the NCBI #
+        threads = str(min(cpus, 8))
+        # The temporary files made while joining the reads go here #
         tmp_dir = new_temp_dir()
-        # Run it #
-        dump('--outdir', tmp_dir, self.source)
-        # Move files #
-        result = tmp_dir + self.source.prefix + '.fastq'
-        result.move_to(self.dest)
+        # Stream the reads to the destination without an intermediate file #
+        command = ['fasterq-dump', '--stdout', '--split-spot',
+                   '--threads', threads, '--temp', tmp_dir.path,
+                   self.source.path]
+        # Compress on the fly if the destination ends with `.gz` #
+        if self.dest.path.endswith('.gz'):
+            if shutil.which('pigz'): zipper = ['pigz', '-c', '-p', str(cpus)]
+            else:                    zipper = ['gzip', '-c']
+        else: zipper = None
+        # Write next to the destination and only rename once complete #
+        part = FilePath(self.dest.path + '.part')
+        # Run it, removing the partial file if anything goes wrong #
+        success = False
+        try:
+            with open(part, 'wb') as handle:
+                if zipper is None: procs = [Popen(command, stdout=handle)]
+                else:
+                    extract = Popen(command, stdout=PIPE)
+                    comp    = Popen(zipper, stdin=extract.stdout, stdout=handle)
+                    extract.stdout.close()
+                    procs   = [extract, comp]
+                codes = [proc.wait() for proc in procs]
+            if any(codes):
+                msg = "Extracting '%s' failed with exit codes %s."
+                raise Exception(msg % (self.source, codes))
+            os.replace(part, self.dest)
+            success = True
+        finally:
+            if not success: part.remove()
+            tmp_dir.remove()
         # Return #
         return self.dest
 
@@ -8,7 +8,7 @@ Contact at www.sinclair.bio
 """
 
 # Built-in modules #
-import socket
+import os, socket
 
 # Internal modules #
 
@@ -62,23 +62,35 @@ class Bundle:
     def __call__(self):
         # Remove the directory if it was created previously #
         self.base_dir.remove()
-        self.base_dir.create()
-        # Loop every sample report #
-        for s in self.project:
-            destination = self.autopaths.samples_dir + s.short_name + '.pdf'
-            s.report.output_path.copy(destination)
-        # Check for any early exit #
+        # Nothing to distribute if the OTUs were not made #
         if not self.project.otus: return
+        # The names inside the archive follow the layout of `all_paths` #
+        def relative(path, *names):
+            return os.path.join(os.path.relpath(str(path), self.base_dir.path),
+                                *names)
+        # Every sample report #
+        samples_dir = self.autopaths.samples_dir
+        entries = [(s.report.output_path,
+                    relative(samples_dir, s.short_name + '.pdf'))
+                   for s in self.project]
         # Report for project #
-        self.project.report.output_path.copy(self.autopaths.report)
+        entries.append((self.project.report.output_path,
+                        relative(self.autopaths.report)))
         # Report for taxonomies #
-        for r in self.project.taxonomy.reports.all:
-            if not r.tax.should_run: continue
-            r.output_path.copy(self.autopaths.taxonomies_dir)
-        # Zip it #
-        self.base_dir.zip_to(self.archive)
-        # Remove the directory #
+        taxonomies_dir = self.autopaths.taxonomies_dir
+        entries += [(r.output_path,
+                     relative(taxonomies_dir, r.output_path.filename))
+                    for r in self.project.taxonomy.reports.all
+                    if r.tax.should_run]
+        # Zip it, reading every file from its original location #
+        # There is no need to copy them all to `base_dir` first
+        import zipfile
+        with zipfile.ZipFile(self.archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for source, name in entries: zf.write(source.path, name)
+        # Remove the directories made when looking up the paths #
         self.base_dir.remove()
+        # Return #
+        return self.archive
 
     #------------------------------- Results ---------------------------------#
     @property_cached
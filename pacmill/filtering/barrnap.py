@@ -13,14 +13,40 @@ import multiprocessing
 # First party modules #
 from fasta import FASTA, FASTQ
 from autopaths.file_path      import FilePath
-from autopaths.tmp_path       import new_temp_dir, new_temp_path
+from autopaths.tmp_path       import new_temp_dir
 from plumbing.cache           import property_cached
 from plumbing.check_cmd_found import check_cmd
 from plumbing.apt_pkg         import get_apt_packages
 from plumbing.scraping        import download_from_url
 
 # Third party modules #
-import sh, tag
+import sh
+
+###############################################################################
+def fastq_as_fasta(path, chunk_size=10000):
+    """
+    Read the FASTQ file at `path` and yield its contents converted to the
+    FASTA format, in chunks of several reads. Every record is expected to
+    span exactly four lines, which is the case for all sequencers
+    we deal with. A record that does not, for instance because it is
+    wrapped or truncated, raises an error.
+    """
+    # The message in case of error #
+    msg = "The FASTQ file '%s' is malformed at record %i, every record " \
+          "must span four lines. The record starts with: '%s'"
+    # Read four lines at a time #
+    with open(path) as handle:
+        chunk, lines = [], iter(handle)
+        for num, header in enumerate(lines, 1):
+            seq, plus, qual = next(lines, None), next(lines, None), \
+                              next(lines, None)
+            if qual is None or header[0] != '@' or plus[0] != '+':
+                raise ValueError(msg % (path, num, header.rstrip()))
+            chunk.append('>' + header[1:] + seq)
+            if len(chunk) == chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk: yield ''.join(chunk)
 
 ###############################################################################
 class Barrnap:
@@ -116,60 +142,89 @@ class Barrnap:
         self.check_installed()
         # Check version #
         assert b"0.9" in sh.barrnap('--version').stderr
-        # If the input is a FASTQ we need to make a FASTA first #
-        if self.source.endswith('fastq'):
-            source = new_temp_path(suffix='.fasta')
-            FASTQ(self.source).to_fasta(source)
-        else: source = self.source
         # Number of cores #
         if cpus is None: cpus = min(multiprocessing.cpu_count(), 32)
-        # Run it #
-        sh.barrnap(source, '--threads', cpus, '--reject',
-                   self.reject_threshold, _out=str(self.dest))
+        # The options #
+        options = ['--threads', cpus, '--reject', self.reject_threshold]
+        # If the input is a FASTQ we convert it to FASTA on the fly #
+        # The FASTA is streamed to barrnap and never written to disk
+        if self.source.endswith('fastq'):
+            sh.barrnap('-', *options, _in=fastq_as_fasta(self.source),
+                       _out=str(self.dest))
+        else:
+            sh.barrnap(self.source, *options, _out=str(self.dest))
         # Return #
         return self.dest
 
     #-------------------------------- Parsing --------------------------------#
-    def parse_hit_ids(self, attr_text):
+    @property_cached
+    def hits(self):
         """
-        Using the GFF output of barrnap and the `tag` parser, we retrieve
-        all IDs that contained a given text in their attributes.
+        Using the GFF output of barrnap, we retrieve in a single pass over
+        the file all the IDs and the start and end positions of reads that
+        contained a 16S or a 23S gene.
+        Returns a dictionary with one entry for each of these four results.
+
+        The lines are simply split on tabs instead of using a full GFF3
+        parser, as we only need four of the nine columns. As in the `tag`
+        package, the positions are converted to zero-based half-open
+        intervals so that they can be used directly to slice sequences.
         """
-        reader = tag.GFF3Reader(infilename=self.dest)
-        reader = tag.select.features(reader, type='rRNA')
-        return [rec.seqid for rec in reader if attr_text in rec.attributes]
+        # Sort the reads that had a rRNA hit depending on the gene found #
+        # The file is read as bytes and only the IDs that matter are decoded
+        loc_16s, loc_23s = {}, {}
+        with open(self.dest, 'rb') as handle:
+            for line in handle:
+                # Skip comments #
+                if line.startswith(b'#'): continue
+                # Skip anything that is not a rRNA feature #
+                parts = line.split(b'\t', 8)
+                if len(parts) < 9 or parts[2] != b'rRNA': continue
+                # Which gene was found #
+                is_16s = b'16S_rRNA' in parts[8]
+                is_23s = b'23S_rRNA' in parts[8]
+                if not (is_16s or is_23s): continue
+                # The position of the gene #
+                seqid    = parts[0].decode()
+                location = (int(parts[3]) - 1, int(parts[4]))
+                if is_16s: loc_16s[seqid] = location
+                if is_23s: loc_23s[seqid] = location
+        # Return #
+        return {'ids_16s': frozenset(loc_16s),
+                'ids_23s': frozenset(loc_23s),
+                'loc_16s': loc_16s,
+                'loc_23s': loc_23s}
 
-    @property_cached
+    @property
     def ids_16s(self):
         """Return read IDs for reads that contained a 16S gene."""
-        return frozenset(self.parse_hit_ids('16S_rRNA'))
+        return self.hits['ids_16s']
 
-    @property_cached
+    @property
     def ids_23s(self):
         """Return read IDs for reads that contained a 23S gene."""
-        return frozenset(self.parse_hit_ids('23S_rRNA'))
+        return self.hits['ids_23s']
 
-    def parse_hit_location(self, attr_text):
-        """
-        Using the GFF output of barrnap and the `tag` parser, we retrieve
-        the start and end position of rRNA genes.
-        """
-        # Get reads that had a rRNA hit #
-        reader = tag.GFF3Reader(infilename=self.dest)
-        reader = tag.select.features(reader, type='rRNA')
-        # Make a lookup table for those with hits #
-        return {rec.seqid: (rec.start, rec.end)
-                for rec in reader if attr_text in rec.attributes}
-
-    @property_cached
+    @property
     def loc_16s(self):
         """Return start and end location of reads that contained a 16S gene."""
-        return self.parse_hit_location('16S_rRNA')
+        return self.hits['loc_16s']
 
-    @property_cached
+    @property
     def loc_23s(self):
         """Return start and end location of reads that contained a 23S gene."""
-        return self.parse_hit_location('23S_rRNA')
+        return self.hits['loc_23s']
+
+    @property_cached
+    def loc_16s_23s(self):
+        """
+        Return both the location of the 16S gene and the location of the
+        23S gene for every read that contained a 16S gene. The second one
+        is None when no 23S gene was found in that read.
+        This way a single lookup is enough for each read.
+        """
+        loc_23s = self.loc_23s
+        return {k: (v, loc_23s.get(k)) for k, v in self.loc_16s.items()}
 
     #------------------------------- Results ---------------------------------#
     def __bool__(self):
@@ -215,8 +270,8 @@ class BarrnapFilter(Barrnap):
             print(msg % self.dest)
         # Get those that had both genes #
         ids_both = self.ids_16s & self.ids_23s
-        # Extract those IDs #
-        FASTQ(self.source).extract_sequences(ids_both, self.filtered)
+        # Extract those IDs in a single pass over the reads #
+        self.filtered.write(r for r in self.source if r.id in ids_both)
         # Return #
         return self.filtered
 
@@ -242,10 +297,12 @@ class BarrnapExtract(Barrnap):
         if verbose:
             msg = "Extracting the 16S rRNA portion of sequences from '%s'"
             print(msg % self.dest)
+        # The lookup table is only retrieved once and not for every read #
+        loc_16s = self.loc_16s
         # Function to yield only the good part of each read #
         def only_16s_portion(reads):
             for r in reads:
-                start_and_end = self.loc_16s.get(r.id)
+                start_and_end = loc_16s.get(r.id)
                 if start_and_end is None: continue
                 start, end = start_and_end
                 yield r[start:end]
@@ -274,14 +331,15 @@ class RemoveITS(Barrnap):
         if verbose:
             msg = "Removing the ITS portion of sequences from '%s'"
             print(msg % self.dest)
+        # The lookup table is only retrieved once and not for every read #
+        locations = self.loc_16s_23s
         # Function to yield concatenated read #
         def concat_16s_23s(reads):
             for r in reads:
-                # Retrieve positions #
-                loc_16s = self.loc_16s.get(r.id)
-                loc_23s = self.loc_23s.get(r.id)
-                # Skip this read if no 16S found #
-                if loc_16s is None: continue
+                # Retrieve positions, skip this read if no 16S found #
+                both = locations.get(r.id)
+                if both is None: continue
+                loc_16s, loc_23s = both
                 # Get only the 16S part in a new sequence #
                 start, end = loc_16s
                 seq = r[start:end]
@@ -17,7 +17,6 @@ from fasta import FASTQ
 from plumbing.cache import property_cached
 
 # Third party modules #
-import pandas
 
 ###############################################################################
 class SeqFilter:
@@ -204,6 +203,8 @@ class SeqFilter:
 
     #-------------------------------- Score ----------------------------------#
     def score_gen(self, reads):
+        # Import only when needed #
+        import pandas
         # Parameters #
         window    = self.phred_window_size
         threshold = self.phred_threshold
@@ -13,8 +13,8 @@ setup(
     packages         = find_packages(),
     install_requires = ['plumbing>=2.9.4', 'autopaths>=1.4.6', 'fasta>=2.2.2',
                         'pymarktex>=1.4.6', 'seqsearch>=1.3.3', 'biopython',
-                        'pandas', 'sh', 'tag', 'shell_command', 'tabulate',
-                        'openpyxl'],
+                        'pandas', 'sh', 'shell_command', 'tabulate',
+                        'openpyxl', 'requests'],
     long_description = open('README.md').read(),
     long_description_content_type = 'text/markdown',
     include_package_data = True,
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+
+Script to test that the cached automatic paths give the same results
+as the original ones.
+"""
+
+# Built-in modules #
+
+# Internal modules #
+from pacmill.core.auto_paths import CachedAutoPaths
+from pacmill.core.project    import Project
+from pacmill.core.sample     import Sample
+
+# First party modules #
+from autopaths.auto_paths import AutoPaths
+
+# Third party modules #
+import pytest
+
+###############################################################################
+keys = {Sample:  ['fastqc_dir', 'len_dist_pdf', 'len_hist_pdf',
+                  'filtered_dir', 'chimeras_cleaned', 'chimeras_rejects',
+                  'barrnap_gff', 'barrnap_fasta', 'report_pdf'],
+        Project: ['all_reads', 'otus_fasta', 'otus_tsv', 'taxonomy_dir',
+                  'ncbi_blast_dir', 'graphs_dir', 'report_pdf', 'log']}
+
+@pytest.mark.parametrize('cls', [Sample, Project])
+def test_same_paths(tmp_path, cls):
+    base_dir = str(tmp_path) + '/'
+    cached   = CachedAutoPaths(base_dir, cls.all_paths)
+    original = AutoPaths(base_dir, cls.all_paths)
+    for key in keys[cls]:
+        # The first access searches and the second one is cached #
+        assert str(getattr(cached, key)) == str(getattr(original, key))
+        assert str(getattr(cached, key)) == str(getattr(original, key))
+
+def test_directory_created_once(tmp_path):
+    base_dir  = str(tmp_path) + '/'
+    cached    = CachedAutoPaths(base_dir, Sample.all_paths)
+    directory = tmp_path / 'chimeras'
+    # The first access creates the parent directory #
+    cached.chimeras_cleaned
+    assert directory.is_dir()
+    # Later accesses don't create it again once it was removed #
+    directory.rmdir()
+    cached.chimeras_cleaned
+    assert not directory.exists()
+    # Unlike the original object #
+    AutoPaths(base_dir, Sample.all_paths).chimeras_cleaned
+    assert directory.is_dir()
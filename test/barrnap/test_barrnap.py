@@ -13,12 +13,13 @@ running them through the barrnap algorithm.
 # Built-in modules #
 
 # Internal modules #
-from pacmill.filtering.barrnap import RemoveITS
+from pacmill.filtering.barrnap import RemoveITS, fastq_as_fasta
 
 # First party modules #
 from fasta import FASTA
 
 # Third party modules #
+import pytest
 
 ###############################################################################
 def test_remove_its(this_script_dir):
@@ -36,3 +37,32 @@ def test_remove_its(this_script_dir):
     its_len = 222
     # Assert #
     assert orig_len - result_len == its_len
+
+def test_parse_gff(this_script_dir, tmp_path):
+    # Get file paths #
+    test_fasta = this_script_dir + 'test_sequence.fasta'
+    test_gff   = this_script_dir + 'test_sequence.barrnap.gff'
+    filtered   = str(tmp_path / 'filtered.fasta')
+    # Create object on an existing barrnap output #
+    barrnap = RemoveITS(test_fasta, test_gff, filtered)
+    # Positions are zero-based and half-open #
+    assert barrnap.loc_16s == {'aj1_3': (1, 1498)}
+    assert barrnap.loc_23s == {'aj1_3': (1717, 4383)}
+    assert barrnap.ids_16s == barrnap.ids_23s == {'aj1_3'}
+    # Remove the ITS without running barrnap again #
+    barrnap.remove_its(verbose=False)
+    orig_len   = len(FASTA(test_fasta).first)
+    result_len = len(barrnap.filtered.first)
+    assert orig_len - result_len == 222
+
+def test_fastq_as_fasta(tmp_path):
+    # Two well formed records #
+    fastq = tmp_path / 'reads.fastq'
+    fastq.write_text("@r1\nACGT\n+\nIIII\n@r2\nGG\n+\nII\n")
+    assert ''.join(fastq_as_fasta(str(fastq))) == ">r1\nACGT\n>r2\nGG\n"
+    # A wrapped record and a truncated one #
+    for content in ["@r1\nAC\nGT\n+\nII\nII\n",
+                    "@r1\nACGT\n+\nIIII\n@r2\nGG\n+\n"]:
+        fastq.write_text(content)
+        with pytest.raises(ValueError, match='malformed'):
+            list(fastq_as_fasta(str(fastq)))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+
+Script to test the creation of the zip archive distributed to users.
+"""
+
+# Built-in modules #
+import zipfile
+from types import SimpleNamespace as Namespace
+
+# Internal modules #
+from pacmill.distribute.bundle import Bundle
+
+# First party modules #
+from autopaths.file_path import FilePath
+
+# Third party modules #
+
+###############################################################################
+class FakeProject(list):
+    """A list of samples with the attributes of a Project."""
+
+def make_report(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b'%PDF ' + name.encode())
+    return Namespace(output_path=FilePath(str(path)))
+
+def make_project(tmp_path, otus=True):
+    samples = [Namespace(short_name=name, report=make_report(tmp_path, name))
+               for name in ('s1', 's2')]
+    project = FakeProject(samples)
+    project.otus    = otus
+    project.report  = make_report(tmp_path, 'project.pdf')
+    taxonomy        = make_report(tmp_path, 'silva.pdf')
+    taxonomy.tax    = Namespace(should_run=True)
+    skipped         = make_report(tmp_path, 'rdp.pdf')
+    skipped.tax     = Namespace(should_run=False)
+    project.taxonomy = Namespace(reports=Namespace(all=[taxonomy, skipped]))
+    return project
+
+###############################################################################
+def test_bundle(tmp_path):
+    base_dir = tmp_path / 'bundle'
+    base_dir.mkdir()
+    (base_dir / 'old.pdf').write_bytes(b'')
+    bundle = Bundle(make_project(tmp_path), str(base_dir) + '/')
+    # Make it #
+    archive = bundle()
+    # The names inside follow `all_paths` #
+    with zipfile.ZipFile(archive) as zf:
+        assert sorted(zf.namelist()) == ['projects/report.pdf',
+                                         'samples/s1.pdf',
+                                         'samples/s2.pdf',
+                                         'taxonomies/silva.pdf']
+        assert zf.read('samples/s1.pdf') == b'%PDF s1'
+    # Nothing is left in the directory from any run #
+    assert not base_dir.exists()
+
+def test_bundle_without_otus(tmp_path):
+    bundle = Bundle(make_project(tmp_path, otus=False),
+                    str(tmp_path / 'bundle') + '/')
+    # No archive is made #
+    assert bundle() is None
+    assert not (tmp_path / 'bundle.zip').exists()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+
+Script to test the parsing of an OTU table and the sums that are
+computed from it to draw the graphs.
+"""
+
+# Built-in modules #
+
+# Internal modules #
+from pacmill.centering.otu_table import OtuTable
+
+# First party modules #
+
+# Third party modules #
+import pytest
+
+###############################################################################
+table = ("#OTU ID\ts1\ts2\ts3\n"
+         "otu_1\t5\t0\t1\n"
+         "otu_2\t0\t0\t2\n"
+         "otu_3\t3\t4\t0\n"
+         "otu_4\t1\t0\t0\n")
+
+###############################################################################
+def test_reductions(tmp_path):
+    # Write the table #
+    tsv_path = tmp_path / 'otus.tsv'
+    tsv_path.write_text(table)
+    # Create object #
+    otu_table = OtuTable(str(tsv_path))
+    # Get the sums #
+    reductions = otu_table.reductions
+    # Assert #
+    assert list(otu_table.df.index) == ['otu_1', 'otu_2', 'otu_3', 'otu_4']
+    assert list(reductions.row_sum)     == [6, 2, 7, 1]
+    assert list(reductions.row_nonzero) == [2, 1, 2, 1]
+    assert list(reductions.col_nonzero) == [3, 1, 2]
+
+###############################################################################
+def test_reductions_numba(tmp_path):
+    # This is an optional dependency #
+    pytest.importorskip('numba')
+    # Write the table #
+    tsv_path = tmp_path / 'otus.tsv'
+    tsv_path.write_text(table)
+    # Create object and force the use of the compiled kernel #
+    otu_table = OtuTable(str(tsv_path))
+    otu_table.numba_threshold = 0
+    # Get the sums #
+    reductions = otu_table.reductions
+    # Assert #
+    assert list(reductions.row_sum)     == [6, 2, 7, 1]
+    assert list(reductions.row_nonzero) == [2, 1, 2, 1]
+    assert list(reductions.col_nonzero) == [3, 1, 2]
+
+###############################################################################
+def test_graphs_empty(tmp_path):
+    # This is needed to draw #
+    pytest.importorskip('matplotlib')
+    # Write a table without any OTUs #
+    tsv_path = tmp_path / 'otus.tsv'
+    tsv_path.write_text("#OTU ID\ts1\ts2\n")
+    # Create object #
+    otu_table = OtuTable(str(tsv_path))
+    # Every graph must still produce its file #
+    for short_name in ['otu_sizes_dist', 'otu_sums_graph',
+                       'sample_sums_graph', 'cumulative_presence']:
+        path = getattr(otu_table.graphs, short_name)()
+        assert path.exists
\ No newline at end of file
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+
+Script to test how a Project reads its metadata and creates its samples.
+"""
+
+# Built-in modules #
+import os
+
+# Internal modules #
+from pacmill.core.project import Project, SampleList, to_records, concat_files
+from pacmill.core.sample  import Sample
+
+# First party modules #
+from autopaths.dir_path import DirectoryPath
+
+# Third party modules #
+import pandas, pytest
+
+###############################################################################
+def write_xlsx(path, **columns):
+    """
+    Write a metadata excel file with the given columns. The first line is
+    left empty and the column names are on the second one, like in the
+    example excel file.
+    """
+    pytest.importorskip('openpyxl')
+    rows = len(next(iter(columns.values())))
+    columns = dict({'project_short_name': ['proj'] * rows,
+                    'sample_short_name':  ['s%i' % i for i in range(rows)],
+                    'used':               ['yes'] * rows}, **columns)
+    pandas.DataFrame(columns).to_excel(str(path), startrow=1, index=False)
+    return str(path)
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the metadata caches of the tests in a temporary directory."""
+    path = str(tmp_path / 'cache') + '/'
+    monkeypatch.setattr(Project, 'cache_dir', DirectoryPath(path))
+    return path
+
+###############################################################################
+@pytest.mark.parametrize('method', ['parallel', 'error', 'missing'])
+def test_concat_files(tmp_path, monkeypatch, method):
+    # Make files of different sizes, including an empty one #
+    contents = [b'>a\nACGT\n', b'', b'>b\n' + b'G' * 100000 + b'\n', b'>c\nT\n']
+    inputs   = []
+    for i, content in enumerate(contents):
+        path = tmp_path / ('input_%i.fasta' % i)
+        path.write_bytes(content)
+        inputs.append(str(path))
+    # Check the parallel method is available #
+    if method == 'parallel' and not hasattr(os, 'copy_file_range'):
+        pytest.skip("No `copy_file_range` on this platform.")
+    # Force the fallback by making the parallel method fail #
+    if method == 'error':
+        def copy_file_range(*args): raise OSError("Not supported")
+        monkeypatch.setattr(os, 'copy_file_range', copy_file_range,
+                            raising=False)
+    # Force the fallback by removing the parallel method #
+    if method == 'missing':
+        monkeypatch.delattr(os, 'copy_file_range', raising=False)
+    # The destination already exists and is longer #
+    dest = tmp_path / 'all.fasta'
+    dest.write_bytes(b'X' * 200000)
+    # Concatenate #
+    concat_files(inputs, str(dest), threads=2)
+    # Assert #
+    assert dest.read_bytes() == b''.join(contents)
+
+###############################################################################
+def test_to_records_mixed_types():
+    # This is an optional dependency #
+    pytest.importorskip('pyarrow')
+    # One column mixes numbers and text, as can happen in excel #
+    df = pandas.DataFrame({'sample_short_name': ['s1', 's2'],
+                           'comment':           [5, 'hello'],
+                           'fwd_read_count':    [10, None]})
+    df = Sample.preprocess_dataframe(df)
+    # Convert #
+    records = to_records(df)
+    # Assert #
+    assert records == [
+        {'sample_short_name': 's1', 'comment': 5,       'fwd_read_count': 10},
+        {'sample_short_name': 's2', 'comment': 'hello', 'fwd_read_count': None},
+    ]
+
+###############################################################################
+def test_metadata_cache_not_writable(tmp_path, cache_dir):
+    # Arrow can't store a column mixing text and numbers #
+    xlsx = write_xlsx(tmp_path / 'metadata.xlsx', comment=['hello', 5])
+    # The metadata is still returned #
+    project = Project('proj', xlsx)
+    assert list(project.metadata['comment']) == ['hello', 5]
+
+def test_metadata_several_files(tmp_path, cache_dir):
+    first  = write_xlsx(tmp_path / 'first.xlsx',  grouping=['a', 'b'])
+    second = write_xlsx(tmp_path / 'second.xlsx', grouping=['c'])
+    # The files are read by several processes and merged in order #
+    project = Project('proj', first, second)
+    assert list(project.metadata['grouping']) == ['a', 'b', 'c']
+
+def test_metadata_cache(tmp_path, cache_dir):
+    # This is an optional dependency #
+    pytest.importorskip('pyarrow')
+    xlsx = write_xlsx(tmp_path / 'metadata.xlsx', grouping=['a', 'b'])
+    # The first project writes the cache in its own directory #
+    project = Project('proj', xlsx)
+    project.metadata
+    cache = project.metadata_cache
+    assert cache.exists
+    directories = os.listdir(cache_dir)
+    assert len(directories) == 1 and directories[0].startswith('proj-')
+    # A second project reads it back #
+    other = Project('proj', xlsx)
+    assert str(other.metadata_cache) == str(cache)
+    assert list(other.metadata['grouping']) == ['a', 'b']
+    # A new format version ignores it and removes it #
+    other = Project('proj', xlsx)
+    other.cache_version = Project.cache_version + 1
+    other.metadata
+    assert str(other.metadata_cache) != str(cache)
+    assert not cache.exists
+    assert other.metadata_cache.exists
+    # Excel files elsewhere with the same project name get their own #
+    (tmp_path / 'elsewhere').mkdir()
+    copy = write_xlsx(tmp_path / 'elsewhere' / 'metadata.xlsx',
+                      grouping=['a', 'b'])
+    elsewhere = Project('proj', copy)
+    elsewhere.metadata
+    assert str(elsewhere.metadata_cache.directory) != \
+           str(other.metadata_cache.directory)
+    assert other.metadata_cache.exists
+
+###############################################################################
+@pytest.mark.parametrize('value', ['12a', 2.5])
+def test_metadata_wrong_integer(tmp_path, cache_dir, value):
+    xlsx = write_xlsx(tmp_path / 'metadata.xlsx', fwd_read_count=[10, value])
+    project = Project('proj', xlsx)
+    # The error names the column and the sample #
+    with pytest.raises(ValueError, match=r"`fwd_read_count` entry of sample 's1'"):
+        project.metadata
+
+def test_metadata_unused_wrong_integer(tmp_path, cache_dir):
+    xlsx = write_xlsx(tmp_path / 'metadata.xlsx', used=['yes', 'no'],
+                      otu_min_size=[2, 'a note'])
+    project = Project('proj', xlsx)
+    # The row that is not used is not checked #
+    values = project.metadata['otu_min_size']
+    assert values[0] == 2 and pandas.isna(values[1])
+
+def test_metadata_empty_integer(tmp_path, cache_dir):
+    xlsx = write_xlsx(tmp_path / 'metadata.xlsx', fwd_read_count=[10, None])
+    project = Project('proj', xlsx)
+    values = project.metadata['fwd_read_count']
+    assert str(values.dtype) == 'Int64'
+    assert values[0] == 10 and pandas.isna(values[1])
+
+###############################################################################
+def test_xlsx_fingerprint(tmp_path, cache_dir):
+    xlsx = write_xlsx(tmp_path / 'metadata.xlsx', grouping=['a', 'b'])
+    project = Project('proj', xlsx)
+    # One entry per file #
+    stat = os.stat(xlsx)
+    assert project.xlsx_fingerprint() == ((xlsx, stat.st_mtime_ns, stat.st_size),)
+    # All missing files are reported at once #
+    missing = [str(tmp_path / 'a.xlsx'), str(tmp_path / 'b.xlsx')]
+    with pytest.raises(Exception, match='a.xlsx\n .*b.xlsx'):
+        Project('proj', xlsx, *missing)
+
+def test_refresh(tmp_path, cache_dir):
+    xlsx = write_xlsx(tmp_path / 'metadata.xlsx', grouping=['a', 'b'])
+    project = Project('proj', xlsx)
+    metadata = project.metadata
+    # Nothing changed #
+    assert project.refresh() is False
+    assert project.metadata is metadata
+    # Edit the file, the properties are not checked on access #
+    write_xlsx(xlsx, grouping=['c', 'd'])
+    os.utime(xlsx, ns=(0, 0))
+    assert project.metadata is metadata
+    # Only an explicit refresh reads the file again #
+    assert project.refresh() is True
+    assert list(project.metadata['grouping']) == ['c', 'd']
+    # Forcing always discards the properties #
+    metadata = project.metadata
+    assert project.refresh(force=True) is True
+    assert project.metadata is not metadata
+
+###############################################################################
+def test_sample_list(project):
+    records = [{'sample_short_name': 's%i' % i,
+                'sample_long_name':  'Sample %i' % i,
+                'sample_num':        i} for i in range(3)]
+    samples = SampleList(project, records)
+    # Nothing is created up front #
+    assert len(samples) == 3
+    assert samples.created == {}
+    # Samples are created once when accessed #
+    last = samples[-1]
+    assert last.short_name == 's2'
+    assert samples[2] is last
+    assert list(samples.created) == [2]
+    # Slices and iteration #
+    assert [s.num for s in samples[:2]] == [0, 1]
+    assert [s.num for s in samples] == [0, 1, 2]
+    with pytest.raises(IndexError): samples[3]
+
+def test_samples_own_primers(project):
+    records = [{'sample_short_name': 's%i' % i,
+                'sample_long_name':  'Sample %i' % i,
+                'sample_num':        i,
+                'fwd_primer_seq':    'ATTTA',
+                'rev_primer_seq':    'AGGGA'} for i in range(2)]
+    first, second = SampleList(project, records)
+    # Samples with the same primers don't share any state #
+    assert first.primers is not second.primers
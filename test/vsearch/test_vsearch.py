@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+
+Script to test the filtering of the OTU FASTA file by byte ranges,
+whatever the number of processes it is split between.
+"""
+
+# Built-in modules #
+
+# Internal modules #
+from pacmill.centering.vsearch import filter_otus, filter_otus_chunk
+
+# First party modules #
+
+# Third party modules #
+import pytest
+
+###############################################################################
+records = [">centroid=a;seqs=10\nACGTACGTAC\nGTACGT\n",
+           ">centroid=b;seqs=3\nTTTT\n",
+           ">centroid=c;seqs=1\nGGGGCCCCAAAATTTT\nGG\nC\n",
+           ">centroid=d;seqs=120\nA\n",
+           ">centroid=e;seqs=7\nCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCC\n"]
+
+keep = frozenset(['a', 'c', 'e'])
+
+expected = ''.join(r for r in records if r.split(';')[0][10:] in keep)
+
+###############################################################################
+@pytest.mark.parametrize('num_chunks', [1, 2, 3, 5, 16, 40, 200])
+def test_filter_otus_chunk(tmp_path, num_chunks):
+    # Write the input #
+    path = tmp_path / 'otus.fasta'
+    path.write_text(''.join(records))
+    # Split it in byte ranges the same way `filter_otus` does #
+    size   = path.stat().st_size
+    bounds = [size * i // num_chunks for i in range(num_chunks + 1)]
+    # Filter every range and concatenate #
+    result = ''
+    for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        out_path = tmp_path / ('part_%i.fasta' % i)
+        filter_otus_chunk((str(path), start, end, keep, str(out_path)))
+        result += out_path.read_text()
+    # Every kept record must be present once and in order #
+    assert result == expected
+
+def test_filter_otus(tmp_path):
+    # Write the input #
+    path = tmp_path / 'otus.fasta'
+    path.write_text(''.join(records))
+    # Force the use of several processes even on this tiny file #
+    out_path = tmp_path / 'filtered.fasta'
+    filter_otus(str(path), str(out_path), keep, cpus=3, threshold=0)
+    # Assert #
+    assert out_path.read_text() == expected
+
+def test_filter_otus_malformed(tmp_path):
+    path = tmp_path / 'otus.fasta'
+    path.write_text(">otu_1\nACGT\n")
+    with pytest.raises(ValueError):
+        filter_otus(str(path), str(tmp_path / 'out.fasta'), keep)
\ No newline at end of file